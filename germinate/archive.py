@@ -22,24 +22,49 @@
 
 from __future__ import print_function
 
+import bz2
 import codecs
-from contextlib import closing, contextmanager
+from contextlib import closing
+from email.utils import formatdate, mktime_tz, parsedate_tz
+import hashlib
 import io
 import logging
+from multiprocessing.pool import ThreadPool
 import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 try:
     from urllib.parse import quote
-    from urllib.request import Request, urlopen
+    from urllib.request import HTTPError, Request, urlopen
 except ImportError:
     from urllib import quote
-    from urllib2 import Request, urlopen
+    from urllib2 import HTTPError, Request, urlopen
+import zlib
 
 import apt_pkg
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from germinate.cache import (
+    cache_home,
+    get_session,
+    part_name,
+    prune_cache,
+    replace,
+    touch,
+    )
+
 
 __pychecker__ = 'no-reuseattr'
 
@@ -70,6 +95,116 @@ else:
         return req.get_selector()
 
 
+# Compression suffixes to try for index files, in order of preference.  xz
+# and gzip are what current archives publish, and are cheaper to decompress
+# than bzip2.
+_SUFFIXES = (".xz", ".gz", ".bz2", "")
+
+# Index files at least this large may be downloaded as several byte ranges
+# at once.
+_SEGMENT_THRESHOLD = 8 << 20
+
+# Size of the chunks in which index files are copied and decompressed.
+# Small chunks spend most of their time in per-call overhead.
+_BUFSIZE = 1 << 17
+
+
+def _find_executable(name):
+    """Return the full path to an executable on $PATH, or None."""
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+_xz = _find_executable("xz")
+
+
+# Errors that decompressors raise for corrupt data, other than IOError.
+if lzma is None:
+    _decompress_errors = (zlib.error,)
+else:
+    _decompress_errors = (zlib.error, lzma.LZMAError)
+
+
+def _decompressor(suffix):
+    """Return a new incremental decompressor for files with this suffix."""
+    if suffix == ".gz":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif suffix == ".bz2":
+        return bz2.BZ2Decompressor()
+    elif suffix == ".xz":
+        if lzma is None:
+            # Let the caller fall back to another suffix.
+            raise IOError("Cannot decompress xz files without lzma or xz")
+        return lzma.LZMADecompressor()
+    else:
+        raise RuntimeError("Unknown suffix '%s'" % suffix)
+
+
+def _copy_decompressed(suffix, in_f, out_f, length=_BUFSIZE):
+    """Decompress in_f into out_f, one chunk at a time.
+
+    This never holds more than a chunk of compressed data in memory, and
+    works on file objects that cannot seek, such as HTTP responses.
+    Concatenated compressed streams are decompressed in sequence.
+
+    """
+    if suffix == ".xz" and _xz is not None:
+        # xz can use several threads to decompress multi-block files, and
+        # runs alongside us in any case.
+        proc = subprocess.Popen(
+            [_xz, "-T0", "-dc"], stdin=subprocess.PIPE, stdout=out_f)
+        try:
+            shutil.copyfileobj(in_f, proc.stdin, length)
+        finally:
+            proc.stdin.close()
+            status = proc.wait()
+        if status != 0:
+            raise IOError("xz failed with exit status %d" % status)
+        return
+
+    decompressor = _decompressor(suffix)
+    while True:
+        data = in_f.read(length)
+        if not data:
+            break
+        while data:
+            try:
+                out_f.write(decompressor.decompress(data))
+            except EOFError:
+                # The previous stream ended exactly at a chunk boundary.
+                decompressor = _decompressor(suffix)
+                continue
+            except _decompress_errors as e:
+                raise IOError("Corrupt %s data: %s" % (suffix, e))
+            data = decompressor.unused_data
+            if data:
+                decompressor = _decompressor(suffix)
+    if not getattr(decompressor, "eof", True):
+        raise IOError("Compressed file ended before the end-of-stream "
+                      "marker was reached")
+
+
+class _SessionResponse(object):
+    """Adapt a streamed requests response to look like a urlopen result."""
+
+    def __init__(self, response):
+        self._response = response
+        # Undo any Content-Encoding; we want the file as published.
+        response.raw.decode_content = True
+
+    def read(self, *args, **kwargs):
+        return self._response.raw.read(*args, **kwargs)
+
+    def info(self):
+        return self._response.headers
+
+    def close(self):
+        self._response.close()
+
+
 class IndexType:
     """Types of archive index files."""
     PACKAGES = 1
@@ -97,8 +232,30 @@ class TagFile(Archive):
     """Fetch package lists from a Debian-format archive as apt tag files."""
 
     def __init__(self, dists, components, arch, mirrors, source_mirrors=None,
-                 installer_packages=True, cleanup=False):
-        """Create a representation of a Debian-format apt archive."""
+                 installer_packages=True, cleanup=False, max_workers=None,
+                 cache_sections=False, download_segments=1, cache=False,
+                 cache_ttl=7):
+        """Create a representation of a Debian-format apt archive.
+
+        Index files are downloaded using up to max_workers threads at once.
+        The default is four threads per mirror, up to a limit of 16.
+
+        If cache_sections is True, parsed sections are kept in memory so
+        that calling sections() again does not need to parse unchanged
+        index files again.  If cache is also True, they are saved in the
+        cache directory too, so that later runs can reuse them.
+
+        If download_segments is greater than one, large index files on
+        HTTP servers that accept byte range requests are
+        downloaded using that many connections at once.
+
+        If cleanup is True, index files are downloaded to a temporary
+        directory which is removed afterwards.  Otherwise, if cache is True,
+        they are kept in a per-user cache directory rather than the current
+        directory, and files there that have not been used for cache_ttl
+        days are removed.
+
+        """
         if isinstance(dists, _string_types):
             dists = [dists]
         if isinstance(components, _string_types):
@@ -118,102 +275,440 @@ class TagFile(Archive):
         else:
             self._source_mirrors = mirrors
         self._cleanup = cleanup
+        # Leaving nothing behind takes precedence over keeping a cache.
+        self._cache = cache and not cleanup
+        self._cache_ttl = cache_ttl
+        if max_workers is None:
+            max_workers = min(16, 4 * len(self._mirrors))
+        self._max_workers = max_workers
+        self._suffix_cache = {}
+        # Keep connections to each mirror alive between downloads.
+        self._session = get_session()
+        self._cache_sections = cache_sections
+        self._download_segments = download_segments
+        self._sections_cache = {}
+
+    def _urlopen(self, req):
+        """Open a URL, reusing connections to HTTP servers if possible.
+
+        Persistent connections need python-requests; without it, or for
+        other kinds of URL, this just calls urlopen.
 
-    def _open_tag_files(self, mirrors, dirname, tagfile_type,
-                        dist, component, ftppath):
-        def _open_tag_file(mirror, suffix):
-            """Download an apt tag file if needed, then open it."""
-            if not mirror.endswith('/'):
-                mirror += '/'
-            url = (mirror + "dists/" + dist + "/" + component + "/" + ftppath +
-                   suffix)
+        """
+        if (self._session is None or
+                get_request_type(req) not in ("http", "https")):
+            return urlopen(req)
+        response = self._session.get(
+            req.get_full_url(), headers=dict(req.header_items()),
+            stream=True)
+        if response.status_code not in (200, 206):
+            response.close()
+            raise HTTPError(req.get_full_url(), response.status_code,
+                            response.reason, response.headers, None)
+        return _SessionResponse(response)
+
+    def _download_ranges(self, url, length, etag, dirname):
+        """Download url as several byte ranges at once.
+
+        Each range is fetched over its own connection.  Return a temporary
+        file containing the whole of url, positioned at the start.
+
+        """
+        segments = self._download_segments
+        segment_size = (length + segments - 1) // segments
+        out_f = tempfile.TemporaryFile(dir=dirname)
+        out_lock = threading.Lock()
+
+        def fetch_range(start, end):
             req = Request(url)
-            filename = None
+            req.add_header("Range", "bytes=%d-%d" % (start, end))
+            if etag is not None:
+                # Refuse a partial response for a different version.
+                req.add_header("If-Range", etag)
+            with closing(self._urlopen(req)) as range_f:
+                content_range = range_f.info().get("Content-Range")
+                if content_range != "bytes %d-%d/%d" % (start, end, length):
+                    raise IOError("Unexpected Content-Range %s for %s" %
+                                  (content_range, url))
+                offset = start
+                while True:
+                    data = range_f.read(_BUFSIZE)
+                    if not data:
+                        break
+                    with out_lock:
+                        out_f.seek(offset)
+                        out_f.write(data)
+                    offset += len(data)
+                if offset != end + 1:
+                    raise IOError("Short read for %s" % url)
+
+        _progress("Downloading %s in %d segments ...", url, segments)
+        ranges = [(start, min(start + segment_size, length) - 1)
+                  for start in range(0, length, segment_size)]
+        pool = ThreadPool(len(ranges))
+        try:
+            fetches = [pool.apply_async(fetch_range, byte_range)
+                       for byte_range in ranges]
+            # Let every range finish with out_f before raising any error.
+            for fetch in fetches:
+                fetch.wait()
+            for fetch in fetches:
+                fetch.get()
+        except Exception:
+            out_f.close()
+            raise
+        finally:
+            pool.terminate()
+            pool.join()
+        out_f.seek(0)
+        return out_f
+
+    def _tag_file_url(self, mirror, suffix, dist, component, ftppath):
+        """Return the URL of an apt tag file on a mirror."""
+        if not mirror.endswith('/'):
+            mirror += '/'
+        return (mirror + "dists/" + dist + "/" + component + "/" + ftppath +
+                suffix)
+
+    def _probe_tag_file(self, url):
+        """Check whether a mirror might have an apt tag file.
 
-            if get_request_type(req) != "file":
-                filename = "%s_%s_%s_%s" % (quote(mirror, safe=""),
-                                            quote(dist, safe=""),
-                                            component, tagfile_type)
+        Only HTTP servers are asked, using a HEAD request; anything else
+        is assumed to be present and is found out when it is fetched.
+        Return False only if the server says the file does not exist.
+
+        """
+        req = Request(url)
+        if get_request_type(req) not in ("http", "https"):
+            return True
+        try:
+            if self._session is not None:
+                response = self._session.head(url, allow_redirects=True)
+                response.close()
+                status = response.status_code
             else:
-                # Make a more or less dummy filename for local URLs.
-                filename = os.path.split(get_request_selector(req))[0].replace(
-                    os.sep, "_")
-
-            fullname = os.path.join(dirname, filename)
-            if get_request_type(req) == "file":
-                # Always refresh.  TODO: we should use If-Modified-Since for
-                # remote HTTP tag files.
+                req.get_method = lambda: "HEAD"
+                urlopen(req).close()
+                status = 200
+        except HTTPError as e:
+            if e.fp is not None:
+                e.fp.close()
+            status = e.code
+        except (IOError, OSError):
+            # Let the download report the error.
+            return True
+        return status not in (404, 410)
+
+    def _request_tag_file(self, mirror, suffix, dirname, tagfile_type,
+                          dist, component, ftppath):
+        """Start downloading an apt tag file.
+
+        Return a (request, local file name, ETag file name, response)
+        tuple.  The response is None if the local copy is still current.
+
+        """
+        url = self._tag_file_url(mirror, suffix, dist, component, ftppath)
+        if not mirror.endswith('/'):
+            mirror += '/'
+        req = Request(url)
+        filename = None
+
+        if get_request_type(req) != "file":
+            filename = "%s_%s_%s_%s" % (quote(mirror, safe=""),
+                                        quote(dist, safe=""),
+                                        component, tagfile_type)
+        else:
+            # Make a more or less dummy filename for local URLs.
+            filename = os.path.split(get_request_selector(req))[0].replace(
+                os.sep, "_")
+
+        fullname = os.path.join(dirname, filename)
+        etagname = fullname + suffix + ".etag"
+        if get_request_type(req) == "file":
+            # Always refresh.
+            try:
+                os.unlink(fullname)
+            except OSError:
+                pass
+        elif os.path.exists(fullname):
+            # Revalidate the cached copy, and only download it again if it
+            # has changed.
+            req.add_header("If-Modified-Since", formatdate(
+                os.stat(fullname).st_mtime, usegmt=True))
+            try:
+                with open(etagname) as etag_f:
+                    req.add_header("If-None-Match", etag_f.read().strip())
+            except IOError:
+                pass
+
+        try:
+            return req, fullname, etagname, self._urlopen(req)
+        except HTTPError as e:
+            # Release the connection now rather than whenever the error is
+            # garbage-collected; most suffixes we try are missing.
+            if e.fp is not None:
+                e.fp.close()
+            if e.code == 304:
+                return req, fullname, etagname, None
+            raise
+
+    def _save_tag_file(self, suffix, dirname, req, fullname, etagname,
+                       url_f):
+        """Finish downloading an apt tag file, returning its local name."""
+        if url_f is None:
+            _progress("Using cached %s file ...", req.get_full_url())
+            touch(fullname)
+            touch(etagname)
+            return fullname
+
+        _progress("Downloading %s file ...", req.get_full_url())
+
+        headers = url_f.info()
+        length = headers.get("Content-Length")
+        if (self._download_segments > 1 and
+                get_request_type(req) in ("http", "https") and
+                headers.get("Accept-Ranges") == "bytes" and
+                length is not None and int(length) >= _SEGMENT_THRESHOLD):
+            url_f.close()
+            try:
+                url_f = self._download_ranges(
+                    req.get_full_url(), int(length), headers.get("ETag"),
+                    dirname)
+            except (IOError, OSError) as e:
+                # The server may not really support ranges; the file
+                # itself was there a moment ago, so fetch it in one piece
+                # before giving up on this suffix.
+                _logger.warning("Segmented download of %s failed (%s); "
+                                "retrying in one piece",
+                                req.get_full_url(), e)
+                url_f = self._urlopen(Request(req.get_full_url()))
+
+        # apt_pkg is weird and won't accept GzipFile, so decompress the
+        # response on the fly as it arrives.
+        # Files are only put in place once complete, so an interrupted
+        # download never leaves a truncated file behind to be revalidated
+        # and parsed next time.  Other processes may share the directory.
+        partname = part_name(fullname)
+        try:
+            with closing(url_f), open(partname, "wb", _BUFSIZE) as f:
+                if suffix:
+                    _copy_decompressed(suffix, url_f, f)
+                else:
+                    shutil.copyfileobj(url_f, f, _BUFSIZE)
+
+            # Remember the validators the server gave us, so that we can
+            # make a conditional request next time.
+            last_modified = headers.get("Last-Modified")
+            if last_modified is not None:
+                last_modified = parsedate_tz(last_modified)
+            if last_modified is not None:
+                os.utime(partname, (time.time(), mktime_tz(last_modified)))
+            replace(partname, fullname)
+        finally:
+            try:
+                os.unlink(partname)
+            except OSError:
+                pass
+
+        etag = headers.get("ETag")
+        if etag is not None and get_request_type(req) != "file":
+            partname = part_name(etagname)
+            try:
+                with open(partname, "w") as etag_f:
+                    print(etag, file=etag_f)
+                replace(partname, etagname)
+            finally:
                 try:
-                    os.unlink(fullname)
+                    os.unlink(partname)
                 except OSError:
                     pass
-            if not os.path.exists(fullname):
-                _progress("Downloading %s file ...", req.get_full_url())
+        else:
+            try:
+                os.unlink(etagname)
+            except OSError:
+                pass
 
-                compressed = os.path.join(dirname, filename + suffix)
-                try:
-                    with closing(urlopen(req)) as url_f, \
-                         open(compressed, "wb") as compressed_f:
-                        compressed_f.write(url_f.read())
-
-                    # apt_pkg is weird and won't accept GzipFile
-                    if suffix:
-                        _progress("Decompressing %s file ...",
-                                  req.get_full_url())
-
-                        if suffix == ".gz":
-                            import gzip
-                            decompressor = gzip.GzipFile
-                        elif suffix == ".bz2":
-                            import bz2
-                            decompressor = bz2.BZ2File
-                        elif suffix == ".xz":
-                            if sys.version >= "3.3":
-                                import lzma
-                                decompressor = lzma.LZMAFile
-                            else:
-                                @contextmanager
-                                def decompressor(name):
-                                    proc = subprocess.Popen(
-                                        ["xzcat", name],
-                                        stdout=subprocess.PIPE)
-                                    yield proc.stdout
-                                    proc.stdout.close()
-                                    proc.wait()
-                        else:
-                            raise RuntimeError("Unknown suffix '%s'" % suffix)
-
-                        with decompressor(compressed) as compressed_f, \
-                             open(fullname, "wb") as f:
-                            f.write(compressed_f.read())
-                            f.flush()
-                finally:
-                    if suffix:
-                        try:
-                            os.unlink(compressed)
-                        except OSError:
-                            pass
-
-            if sys.version_info[0] < 3:
-                return codecs.open(fullname, 'r', 'UTF-8', 'replace')
-            else:
-                return io.open(fullname, mode='r', encoding='UTF-8',
-                               errors='replace')
+        return fullname
+
+    def _download_tag_file(self, mirror, suffix, dirname, tagfile_type,
+                           dist, component, ftppath):
+        """Download an apt tag file if needed, returning its local name."""
+        return self._save_tag_file(suffix, dirname, *self._request_tag_file(
+            mirror, suffix, dirname, tagfile_type, dist, component, ftppath))
+
+    def _fetch_tag_file(self, probe_pool, mirror, dirname, tagfile_type,
+                        dist, component, ftppath):
+        """Fetch an apt tag file from a single mirror.
 
+        The compression suffix that worked last time is tried first.
+        Otherwise, the mirror is asked which suffixes it has, all at once
+        on probe_pool, and each of those is tried in order of preference
+        until one downloads and decompresses successfully.  Return the
+        local file name, or None if the mirror has no usable such file.
+
+        """
+        key = (mirror, dist, component, tagfile_type)
+        suffixes = list(_SUFFIXES)
+        if key in self._suffix_cache:
+            suffix = self._suffix_cache[key]
+            try:
+                return self._download_tag_file(
+                    mirror, suffix, dirname, tagfile_type,
+                    dist, component, ftppath)
+            except (IOError, OSError):
+                suffixes.remove(suffix)
+
+        probes = [
+            (suffix, probe_pool.apply_async(
+                self._probe_tag_file,
+                (self._tag_file_url(
+                    mirror, suffix, dist, component, ftppath),)))
+            for suffix in suffixes]
+        for suffix, probe in probes:
+            if not probe.get():
+                continue
+            try:
+                request = self._request_tag_file(
+                    mirror, suffix, dirname, tagfile_type,
+                    dist, component, ftppath)
+            except (IOError, OSError):
+                continue
+            try:
+                fullname = self._save_tag_file(suffix, dirname, *request)
+            except (IOError, OSError):
+                # Perhaps a truncated file, or one we cannot decompress;
+                # fall back to the next suffix.
+                if request[3] is not None:
+                    request[3].close()
+                continue
+            self._suffix_cache[key] = suffix
+            return fullname
+        return None
+
+    def _fetch_tag_files(self, pool, probe_pool, mirrors, dirname,
+                         tagfile_type, dist, component, ftppath):
+        """Start fetching an apt tag file from each of mirrors in pool."""
+        return [
+            ((mirror, dist, component, tagfile_type),
+             pool.apply_async(
+                 self._fetch_tag_file,
+                 (probe_pool, mirror, dirname, tagfile_type, dist, component,
+                  ftppath)))
+            for mirror in mirrors]
+
+    def _wait_tag_files(self, fetches, tagfile_type):
+        """Wait for a set of fetches to complete.
+
+        Return a list of (key, local file name) pairs for the mirrors that
+        had the requested file.
+
+        """
         tag_files = []
-        for mirror in mirrors:
-            tag_file = None
-            for suffix in (".xz", ".bz2", ".gz", ""):
-                try:
-                    tag_file = _open_tag_file(mirror, suffix)
-                    tag_files.append(tag_file)
-                    break
-                except (IOError, OSError):
-                    pass
+        for key, fetch in fetches:
+            fullname = fetch.get()
+            if fullname is not None:
+                tag_files.append((key, fullname))
         if len(tag_files) == 0:
             raise IOError("no %s files found" % tagfile_type)
         return tag_files
 
+    def _open_tag_file(self, fullname):
+        """Open a downloaded apt tag file."""
+        if sys.version_info[0] < 3:
+            tag_file = codecs.open(fullname, 'r', 'UTF-8', 'replace')
+        else:
+            tag_file = io.open(fullname, mode='r', encoding='UTF-8',
+                               errors='replace')
+        # apt_pkg reads the whole file straight from its descriptor, so
+        # tell the kernel to read ahead aggressively.
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(
+                    tag_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        return tag_file
+
+    def _load_sections(self, fullname, stamp):
+        """Load saved sections for fullname, if they are still current."""
+        try:
+            with open(fullname + ".sections", "rb") as sections_f:
+                saved_stamp, saved = pickle.load(sections_f)
+        except Exception:
+            # Missing, unreadable, or written by an incompatible Python.
+            return None
+        if saved_stamp != stamp:
+            return None
+        return saved
+
+    def _save_sections(self, fullname, stamp, sections):
+        """Save parsed sections for fullname alongside it."""
+        sectionsname = fullname + ".sections"
+        partname = part_name(sectionsname)
+        try:
+            with open(partname, "wb") as sections_f:
+                # Protocol 2 can be read by both Python 2 and Python 3.
+                pickle.dump((stamp, sections), sections_f, 2)
+            replace(partname, sectionsname)
+        except (IOError, OSError):
+            pass
+        finally:
+            try:
+                os.unlink(partname)
+            except OSError:
+                pass
+
+    def _tag_file_sections(self, tag_files):
+        """Yield the sections found in a list of downloaded apt tag files.
+
+        If section caching is enabled, sections are remembered as plain
+        dictionaries, and reused as long as the file they came from has
+        the same size and modification time.
+
+        """
+        for key, fullname in tag_files:
+            if self._cache_sections:
+                st = os.stat(fullname)
+                stamp = (st.st_size, st.st_mtime)
+                if key in self._sections_cache:
+                    cached_stamp, cached = self._sections_cache[key]
+                    if cached_stamp == stamp:
+                        for section in cached:
+                            yield section
+                        continue
+                if self._cache:
+                    cached = self._load_sections(fullname, stamp)
+                    if cached is not None:
+                        self._sections_cache[key] = (stamp, cached)
+                        for section in cached:
+                            yield section
+                        continue
+                cached = []
+
+            tag_file = self._open_tag_file(fullname)
+            try:
+                for section in apt_pkg.TagFile(tag_file):
+                    if self._cache_sections:
+                        section = dict(section)
+                        cached.append(section)
+                    yield section
+            finally:
+                tag_file.close()
+
+            if self._cache_sections:
+                self._sections_cache[key] = (stamp, cached)
+                if self._cache:
+                    self._save_sections(fullname, stamp, cached)
+
+    def _cache_dir(self):
+        """Return the cache directory for this archive's mirrors."""
+        mirrors = sorted(set(self._mirrors) | set(self._source_mirrors))
+        digest = hashlib.sha1(repr(mirrors).encode("UTF-8")).hexdigest()
+        dirname = os.path.join(cache_home(), "germinate", digest)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        return dirname
+
     def sections(self):
         """Yield a sequence of the index sections found in this archive.
 
@@ -226,52 +721,66 @@ class TagFile(Archive):
         """
         if self._cleanup:
             dirname = tempfile.mkdtemp(prefix="germinate-")
+        elif self._cache:
+            dirname = self._cache_dir()
         else:
             dirname = '.'
 
+        # Downloads are I/O-bound, so start them all at once on a bounded
+        # pool of threads, and parse the results in order as they arrive.
+        # Probes are cheap HEAD requests, only made when the suffix that
+        # worked last time is unknown or fails; they get a pool of their
+        # own, since fetches wait for them.
+        pool = ThreadPool(self._max_workers)
+        probe_pool = ThreadPool(self._max_workers)
         try:
+            fetches = []
             for dist in self._dists:
                 for component in self._components:
-                    packages = self._open_tag_files(
-                        self._mirrors, dirname, "Packages", dist, component,
+                    packages = self._fetch_tag_files(
+                        pool, probe_pool, self._mirrors, dirname, "Packages",
+                        dist, component,
                         "binary-" + self._arch + "/Packages")
-                    for tag_file in packages:
-                        try:
-                            for section in apt_pkg.TagFile(tag_file):
-                                yield (IndexType.PACKAGES, section)
-                        finally:
-                            tag_file.close()
-
-                    sources = self._open_tag_files(
-                        self._source_mirrors, dirname, "Sources", dist,
-                        component, "source/Sources")
-                    for tag_file in sources:
-                        try:
-                            for section in apt_pkg.TagFile(tag_file):
-                                yield (IndexType.SOURCES, section)
-                        finally:
-                            tag_file.close()
-
-                    instpackages = ""
+                    sources = self._fetch_tag_files(
+                        pool, probe_pool, self._source_mirrors, dirname,
+                        "Sources", dist, component, "source/Sources")
                     if self._installer_packages:
-                        try:
-                            instpackages = self._open_tag_files(
-                                self._mirrors, dirname, "InstallerPackages",
-                                dist, component,
-                                "debian-installer/binary-" + self._arch +
-                                "/Packages")
-                        except IOError:
-                            # can live without these
-                            _progress("Missing installer Packages file for %s "
-                                      "(ignoring)", component)
-                        else:
-                            for tag_file in instpackages:
-                                try:
-                                    for section in apt_pkg.TagFile(tag_file):
-                                        yield (IndexType.INSTALLER_PACKAGES,
-                                               section)
-                                finally:
-                                    tag_file.close()
+                        instpackages = self._fetch_tag_files(
+                            pool, probe_pool, self._mirrors, dirname,
+                            "InstallerPackages", dist, component,
+                            "debian-installer/binary-" + self._arch +
+                            "/Packages")
+                    else:
+                        instpackages = None
+                    fetches.append(
+                        (component, packages, sources, instpackages))
+
+            for component, packages, sources, instpackages in fetches:
+                packages = self._wait_tag_files(packages, "Packages")
+                for section in self._tag_file_sections(packages):
+                    yield (IndexType.PACKAGES, section)
+
+                sources = self._wait_tag_files(sources, "Sources")
+                for section in self._tag_file_sections(sources):
+                    yield (IndexType.SOURCES, section)
+
+                if instpackages is not None:
+                    try:
+                        instpackages = self._wait_tag_files(
+                            instpackages, "InstallerPackages")
+                    except IOError:
+                        # can live without these
+                        _progress("Missing installer Packages file for %s "
+                                  "(ignoring)", component)
+                    else:
+                        for section in self._tag_file_sections(instpackages):
+                            yield (IndexType.INSTALLER_PACKAGES, section)
         finally:
+            pool.terminate()
+            pool.join()
+            probe_pool.terminate()
+            probe_pool.join()
             if self._cleanup:
-                shutil.rmtree(dirname)
+                shutil.rmtree(dirname, ignore_errors=True)
+            elif self._cache:
+                prune_cache(dirname, self._cache_ttl)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Cache and HTTP session helpers shared by Germinate's fetchers."""
+
+# Copyright (c) 2004, 2005, 2006, 2007, 2008, 2009, 2010, 2011, 2012
+#               Canonical Ltd.
+#
+# Germinate is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2, or (at your option) any
+# later version.
+#
+# Germinate is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Germinate; see the file COPYING.  If not, write to the Free
+# Software Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import sys
+import threading
+import time
+
+try:
+    import requests
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+
+__all__ = [
+    'cache_home',
+    'get_session',
+    'part_name',
+    'prune_cache',
+    'replace',
+    'touch',
+    ]
+
+
+def part_name(path):
+    """Return a staging file name for path unique to this thread."""
+    return "%s.%d.%d.part" % (
+        path, os.getpid(), threading.current_thread().ident)
+
+
+if sys.version >= '3.3':
+    replace = os.replace
+else:
+    # Atomic on POSIX, which is all that Python 2 germinate supports.
+    replace = os.rename
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return a python-requests session shared by all fetchers.
+
+    Sharing the session lets connections to a mirror be reused across
+    archives and seeds, and bounds the number kept open.  Return None if
+    python-requests is unavailable.
+
+    """
+    global _session
+    if requests is None:
+        return None
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=16, pool_maxsize=32,
+                max_retries=Retry(total=3, backoff_factor=0.3))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def cache_home():
+    """Return the base directory for user-specific cached data."""
+    return (os.environ.get("XDG_CACHE_HOME") or
+            os.path.join(os.path.expanduser("~"), ".cache"))
+
+
+def prune_cache(dirname, ttl):
+    """Remove files from dirname that have not been used for ttl days."""
+    cutoff = time.time() - ttl * 24 * 60 * 60
+    for name in os.listdir(dirname):
+        path = os.path.join(dirname, name)
+        try:
+            if os.stat(path).st_atime < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def touch(path):
+    """Record that path was used just now, without changing its mtime."""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
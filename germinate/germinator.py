@@ -27,6 +27,7 @@ from collections import (
     )
 import fnmatch
 import logging
+import operator
 import re
 import sys
 
@@ -52,6 +53,20 @@ BUILD_DEPENDS = (
 _logger = logging.getLogger(__name__)
 
 
+# Splits seed entries around substitution variables such as ${name}.
+_substvar_re = re.compile(r'(\${.*?})')
+
+# Maps dependency relations to tests on the result of version_compare.
+_dependency_relations = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+    "=": operator.eq,
+    "!=": operator.ne,
+}
+
+
 try:
     apt_pkg.parse_src_depends("dummy:any", False)
     _apt_pkg_multiarch = True
@@ -122,6 +137,33 @@ class SeedKernelVersions(object):
         self.kernel_versions = set(kernel_versions)
 
 
+class _Package(object):
+    """A binary package parsed from a Packages file.
+
+    There are a great many of these, so they use slots rather than a
+    dictionary each.  Fields may also be looked up by their control field
+    names.
+
+    """
+
+    __slots__ = (
+        'section', 'version', 'maintainer', 'essential', 'pre_depends',
+        'depends', 'recommends', 'built_using', 'size', 'installed_size',
+        'source', 'provides', 'multi_arch', 'kernel_version',
+        'reverse_depends',
+    )
+
+    def __init__(self):
+        self.reverse_depends = None
+
+    @staticmethod
+    def _attr(field):
+        return field.lower().replace('-', '_')
+
+    def __getitem__(self, field):
+        return getattr(self, self._attr(field))
+
+
 class GerminatedSeed(object):
     def __init__(self, germinator, name, structure, raw_seed):
         self._germinator = germinator
@@ -132,6 +174,9 @@ class GerminatedSeed(object):
         self._entries = []
         self._features = set()
         self._recommends_entries = []
+        # Sets of the above, for fast membership tests.
+        self._entries_set = set()
+        self._recommends_entries_set = set()
         self._snaps = set()
         self._close_seeds = set()
         self._depends = set()
@@ -143,6 +188,8 @@ class GerminatedSeed(object):
         self._not_build = set()
         self._build_srcs = set()
         self._not_build_srcs = set()
+        # Sources whose build-dependencies have been added to this seed.
+        self._followed_build_srcs = set()
         self._reasons = {}
         self._snap_reasons = {}
         self._blacklist = set()
@@ -155,8 +202,11 @@ class GerminatedSeed(object):
         self._seed_reason = SeedReason(structure.branch, name)
         self._grown = False
         self._cache_inner_seeds = None
+        self._cache_strictly_inner_unions = {}
         self._cache_strictly_outer_seeds = None
+        self._cache_close_strictly_outer_seeds = None
         self._cache_outer_seeds = None
+        self._cache_outer_blacklist = None
 
     def copy_plant(self, structure):
         """Return a copy of this seed attached to a different structure.
@@ -173,6 +223,8 @@ class GerminatedSeed(object):
         new._entries = self._entries
         new._features = self._features
         new._recommends_entries = self._recommends_entries
+        new._entries_set = self._entries_set
+        new._recommends_entries_set = self._recommends_entries_set
         new._close_seeds = self._close_seeds
         new._blacklist = self._blacklist
         new._includes = self._includes
@@ -199,6 +251,8 @@ class GerminatedSeed(object):
         # would take up substantial amounts of memory.
         self._entries = copy._entries
         self._recommends_entries = copy._recommends_entries
+        self._entries_set = copy._entries_set
+        self._recommends_entries_set = copy._recommends_entries_set
         self._depends = copy._depends
         self._snaps = copy._snaps
         self._build_depends = copy._build_depends
@@ -394,6 +448,7 @@ class Germinator(object):
 
         # Global hints file.
         self._hints = {}
+        self._hints_by_seed = defaultdict(OrderedDict)
 
         # Parsed representation of the archive.
         self._packages = {}
@@ -414,31 +469,62 @@ class Germinator(object):
 
         self._always_follow_build_depends = False
 
+        # Compiled seed entry patterns, for _filter_packages.
+        self._pattern_cache = {}
+
+        # Results of versioned dependency checks, keyed by (candidate
+        # version, dependency version, relation).
+        self._version_cache = {}
+
+        # Results of _allowed_dependency apart from d-i kernel version
+        # pruning, keyed by (pkg, depend, build_depend).
+        self._allowed_cache = {}
+
+        # Parsed dependency fields, keyed by the raw field value.  The
+        # same values turn up in many stanzas, and the parsed forms are
+        # never modified, so they can be shared.
+        self._depends_cache = {}
+        self._src_depends_cache = {}
+
     # Parsing.
     # --------
 
     def parse_hints(self, f):
         """Parse a hints file."""
         for line in f:
-            if line.startswith("#") or not len(line.rstrip()):
+            if line.startswith("#"):
                 continue
 
-            words = line.rstrip().split(None)
+            # Blank lines split into no words at all.
+            words = line.split()
             if len(words) != 2:
                 continue
 
-            self._hints[words[1]] = words[0]
+            seedname, pkg = words
+            if pkg in self._hints:
+                del self._hints_by_seed[self._hints[pkg]][pkg]
+            self._hints[pkg] = seedname
+            self._hints_by_seed[seedname][pkg] = None
         f.close()
 
     def _parse_depends(self, value):
         """Parse Depends from value, without stripping qualifiers."""
+        # Most of these fields are empty or missing.
+        if not value:
+            return []
+        try:
+            return self._depends_cache[value]
+        except KeyError:
+            pass
         try:
             if _apt_pkg_multiarch:
-                return apt_pkg.parse_depends(value, False)
+                parsed = apt_pkg.parse_depends(value, False)
             else:
-                return apt_pkg.parse_depends(value)
+                parsed = apt_pkg.parse_depends(value)
         except ValueError as e:
             raise ValueError("%s (%s)" % (e, value))
+        self._depends_cache[value] = parsed
+        return parsed
 
     def _parse_package(self, section, pkgtype):
         """Parse a section from a Packages file."""
@@ -446,53 +532,56 @@ class Germinator(object):
         ver = section["Version"]
 
         # If we have already seen an equal or newer version of this package,
-        # then skip this section.
+        # then skip this section.  The same version often turns up in
+        # several index files, so check for that cheaply first.
         if pkg in self._packages:
-            last_ver = self._packages[pkg]["Version"]
-            if apt_pkg.version_compare(last_ver, ver) >= 0:
+            last_ver = self._packages[pkg].version
+            if (last_ver == ver or
+                    apt_pkg.version_compare(last_ver, ver) >= 0):
                 return
 
-        self._packages[pkg] = {}
+        get = section.get
+        info = _Package()
+        self._packages[pkg] = info
         self._packagetype[pkg] = pkgtype
 
-        self._packages[pkg]["Section"] = \
-            section.get("Section", "").split('/')[-1]
+        info.section = get("Section", "").rpartition('/')[2]
 
-        self._packages[pkg]["Version"] = ver
+        info.version = ver
 
-        self._packages[pkg]["Maintainer"] = \
-            _ensure_unicode(section.get("Maintainer", ""))
+        info.maintainer = _ensure_unicode(get("Maintainer", ""))
 
-        self._packages[pkg]["Essential"] = section.get("Essential", "")
+        info.essential = get("Essential", "")
 
-        for field in "Pre-Depends", "Depends", "Recommends", "Built-Using":
-            value = section.get(field, "")
-            try:
-                self._packages[pkg][field] = self._parse_depends(value)
-            except ValueError:
-                if field == "Built-Using":
-                    _logger.error(
-                        "Package %s has invalid Built-Using: %s", pkg, value)
-                else:
-                    raise
+        info.pre_depends = self._parse_depends(get("Pre-Depends", ""))
+        info.depends = self._parse_depends(get("Depends", ""))
+        info.recommends = self._parse_depends(get("Recommends", ""))
+        value = get("Built-Using", "")
+        try:
+            info.built_using = self._parse_depends(value)
+        except ValueError:
+            _logger.error(
+                "Package %s has invalid Built-Using: %s", pkg, value)
+            info.built_using = []
 
-        for field in "Size", "Installed-Size":
-            value = section.get(field, "0")
-            self._packages[pkg][field] = int(value)
+        info.size = int(get("Size", "0"))
+        info.installed_size = int(get("Installed-Size", "0"))
 
-        src = section.get("Source", pkg)
+        src = get("Source", pkg)
         idx = src.find("(")
         if idx != -1:
             src = src[:idx].strip()
-        self._packages[pkg]["Source"] = src
+        info.source = src
 
-        self._packages[pkg]["Provides"] = apt_pkg.parse_depends(
-            section.get("Provides", ""))
+        provides = get("Provides")
+        if provides:
+            info.provides = apt_pkg.parse_depends(provides)
+        else:
+            info.provides = []
 
-        self._packages[pkg]["Multi-Arch"] = section.get("Multi-Arch", "none")
+        info.multi_arch = get("Multi-Arch", "none")
 
-        self._packages[pkg]["Kernel-Version"] = section.get(
-            "Kernel-Version", "")
+        info.kernel_version = get("Kernel-Version", "")
 
     def _strip_restrictions(self, value):
         # Work around lack of https://wiki.debian.org/BuildProfileSpec
@@ -560,20 +649,28 @@ class Germinator(object):
 
     def _parse_src_depends(self, value):
         """Parse Build-Depends from value, without stripping qualifiers."""
+        if not value:
+            return []
+        try:
+            return self._src_depends_cache[value]
+        except KeyError:
+            pass
         try:
             if _apt_pkg_multiarch:
-                return apt_pkg.parse_src_depends(value, False)
+                parsed = apt_pkg.parse_src_depends(value, False)
             else:
-                return apt_pkg.parse_src_depends(value)
+                parsed = apt_pkg.parse_src_depends(value)
         except ValueError:
-            value = self._strip_restrictions(value)
+            stripped = self._strip_restrictions(value)
             try:
                 if _apt_pkg_multiarch:
-                    return apt_pkg.parse_src_depends(value, False)
+                    parsed = apt_pkg.parse_src_depends(stripped, False)
                 else:
-                    return apt_pkg.parse_src_depends(value)
+                    parsed = apt_pkg.parse_src_depends(stripped)
             except ValueError as e:
-                raise ValueError("%s (%s)" % (e, value))
+                raise ValueError("%s (%s)" % (e, stripped))
+        self._src_depends_cache[value] = parsed
+        return parsed
 
     def _parse_source(self, section):
         """Parse a section from a Sources file."""
@@ -584,21 +681,22 @@ class Germinator(object):
         # then skip this section.
         if src in self._sources:
             last_ver = self._sources[src]["Version"]
-            if apt_pkg.version_compare(last_ver, ver) >= 0:
+            if (last_ver == ver or
+                    apt_pkg.version_compare(last_ver, ver) >= 0):
                 return
 
-        self._sources[src] = {}
+        get = section.get
+        info = {}
+        self._sources[src] = info
 
-        self._sources[src]["Maintainer"] = \
-            _ensure_unicode(section.get("Maintainer", ""))
-        self._sources[src]["Version"] = ver
+        info["Maintainer"] = _ensure_unicode(get("Maintainer", ""))
+        info["Version"] = ver
 
         for field in BUILD_DEPENDS:
-            value = section.get(field, "")
-            self._sources[src][field] = self._parse_src_depends(value)
+            info[field] = self._parse_src_depends(get(field, ""))
 
-        binaries = apt_pkg.parse_depends(section.get("Binary", src))
-        self._sources[src]["Binaries"] = [b[0][0] for b in binaries]
+        binaries = apt_pkg.parse_depends(get("Binary", src))
+        info["Binaries"] = [b[0][0] for b in binaries]
 
     def parse_archive(self, archive):
         """Parse an archive.
@@ -606,19 +704,21 @@ class Germinator(object):
         This must be called before planting any seeds.
 
         """
+        parse_package = self._parse_package
+        parse_source = self._parse_source
         for indextype, section in archive.sections():
             if indextype == IndexType.PACKAGES:
-                self._parse_package(section, "deb")
+                parse_package(section, "deb")
             elif indextype == IndexType.SOURCES:
-                self._parse_source(section)
+                parse_source(section)
             elif indextype == IndexType.INSTALLER_PACKAGES:
-                self._parse_package(section, "udeb")
+                parse_package(section, "udeb")
             else:
                 raise ValueError("Unknown index type %d" % indextype)
 
         # Construct a more convenient representation of Provides fields.
         for pkg in sorted(self._packages):
-            for prov in self._packages[pkg]["Provides"]:
+            for prov in self._packages[pkg].provides:
                 if prov[0][2] not in ("", "="):
                     _logger.warning(
                         "Ignoring invalid Provides: %s by %s",
@@ -657,6 +757,22 @@ class Germinator(object):
                     for seedname in seed.structure.inner_seeds(seed.name)]
         return seed._cache_inner_seeds
 
+    def _strictly_inner_union(self, seed, attr):
+        """Return the union of a set attribute over strictly inner seeds.
+
+        This is only computed once per seed and attribute, the first time
+        it is needed while growing seed; by then all of its strictly inner
+        seeds have been grown and will not change further.
+        """
+        unions = seed._cache_strictly_inner_unions
+        if attr not in unions:
+            union = set()
+            for innerseed in self._inner_seeds(seed):
+                if innerseed.name != seed.name:
+                    union.update(getattr(innerseed, attr))
+            unions[attr] = union
+        return unions[attr]
+
     def _strictly_outer_seeds(self, seed):
         if seed._cache_strictly_outer_seeds is None:
             branch = seed.structure.branch
@@ -670,6 +786,13 @@ class Germinator(object):
             seed._cache_strictly_outer_seeds = ret
         return seed._cache_strictly_outer_seeds
 
+    def _close_strictly_outer_seeds(self, seed):
+        if seed._cache_close_strictly_outer_seeds is None:
+            seed._cache_close_strictly_outer_seeds = [
+                l for l in self._strictly_outer_seeds(seed)
+                if seed.name in l._close_seeds]
+        return seed._cache_close_strictly_outer_seeds
+
     def _outer_seeds(self, seed):
         if seed._cache_outer_seeds is None:
             branch = seed.structure.branch
@@ -698,17 +821,20 @@ class Germinator(object):
         surrounded by slashes) an extended regular expression."""
 
         if pattern.startswith('/') and pattern.endswith('/'):
-            patternre = re.compile(pattern[1:-1])
-            filtered = [p for p in packages if patternre.search(p) is not None]
+            if pattern not in self._pattern_cache:
+                self._pattern_cache[pattern] = re.compile(
+                    pattern[1:-1]).search
         elif '*' in pattern or '?' in pattern or '[' in pattern:
-            filtered = fnmatch.filter(packages, pattern)
+            if pattern not in self._pattern_cache:
+                self._pattern_cache[pattern] = re.compile(
+                    fnmatch.translate(pattern)).match
         else:
             # optimisation for common case
             if pattern in packages:
                 return [pattern]
             else:
                 return []
-        return sorted(filtered)
+        return sorted(filter(self._pattern_cache[pattern], packages))
 
     def _substitute_seed_vars(self, substvars, pkg):
         """Process substitution variables. These look like ${name} (e.g.
@@ -720,7 +846,9 @@ class Germinator(object):
         one package for each possible combination of values of those
         variables."""
 
-        pieces = re.split(r'(\${.*?})', pkg)
+        if '${' not in pkg:
+            return [pkg]
+        pieces = _substvar_re.split(pkg)
         substituted = [[]]
 
         for piece in pieces:
@@ -752,8 +880,8 @@ class Germinator(object):
         which we inherit?"""
 
         for innerseed in self._inner_seeds(seed):
-            if (pkg in innerseed._entries or
-                pkg in innerseed._recommends_entries):
+            if (pkg in innerseed._entries_set or
+                pkg in innerseed._recommends_entries_set):
                 return True
 
         return False
@@ -869,17 +997,19 @@ class Germinator(object):
 
             # a (pkgname) indicates that this is a recommend
             # and not a depends
+            recommends_pkgs = None
             if pkg.startswith('(') and pkg.endswith(')'):
                 pkg = pkg[1:-1]
                 if is_snap or pkg.startswith("snap:"):
                     _logger.warning("Recommends entries cannot be used with snap packages, ignoring %s", pkg)
                     continue
-                pkgs = self._filter_packages(self._packages, pkg)
-                if not pkgs:
-                    pkgs = [pkg]  # virtual or expanded; check again later
-                for pkg in pkgs:
+                recommends_pkgs = self._filter_packages(self._packages, pkg)
+                if not recommends_pkgs:
+                    # virtual or expanded; check again later
+                    recommends_pkgs = [pkg]
+                for recommends_pkg in recommends_pkgs:
                     seedrecommends.extend(self._substitute_seed_vars(
-                        substvars, pkg))
+                        substvars, recommends_pkg))
 
             if is_snap and pkg.startswith('%'):
                 _logger.warning("%% entries cannot be used with snap packages, ignoring %s", pkg)
@@ -895,6 +1025,8 @@ class Germinator(object):
                     pkgs = []
             elif is_snap:
                 pkgs = [pkg]
+            elif recommends_pkgs is not None:
+                pkgs = recommends_pkgs
             else:
                 pkgs = self._filter_packages(self._packages, pkg)
                 if not pkgs:
@@ -933,8 +1065,10 @@ class Germinator(object):
                 else:
                     if pkg in seedrecommends:
                         seed._recommends_entries.append(pkg)
+                        seed._recommends_entries_set.add(pkg)
                     else:
                         seed._entries.append(pkg)
+                        seed._entries_set.add(pkg)
             elif pkg in self._provides:
                 # Virtual package, include everything
                 msg = "Virtual %s package: %s" % (seed, pkg)
@@ -947,8 +1081,10 @@ class Germinator(object):
                         msg += "\n  - %s" % vpkg
                         if pkg in seedrecommends:
                             seed._recommends_entries.append(vpkg)
+                            seed._recommends_entries_set.add(vpkg)
                         else:
                             seed._entries.append(vpkg)
+                            seed._entries_set.add(vpkg)
                 _logger.info("%s", msg)
 
             else:
@@ -958,14 +1094,15 @@ class Germinator(object):
         for pkg in seedsnaps:
             seed._snaps.add(pkg)
 
-        for pkg in self._hints:
-            if (self._hints[pkg] == seed.name and
-                not self._already_seeded(seed, pkg)):
+        for pkg in self._hints_by_seed.get(seed.name, ()):
+            if not self._already_seeded(seed, pkg):
                 if pkg in self._packages:
                     if pkg in seedrecommends:
                         seed._recommends_entries.append(pkg)
+                        seed._recommends_entries_set.add(pkg)
                     else:
                         seed._entries.append(pkg)
+                        seed._entries_set.add(pkg)
                 else:
                     _logger.error("Unknown hinted package: %s", pkg)
 
@@ -986,23 +1123,45 @@ class Germinator(object):
         if not di_kernel_versions or not di_kernel_versions.kernel_versions:
             return False
         kernvers = di_kernel_versions.kernel_versions
-        kernver = self._packages[pkg]["Kernel-Version"]
+        kernver = self._packages[pkg].kernel_version
         return kernver != "" and kernver not in kernvers
 
-    def _weed_blacklist(self, pkgs, seed, build_tree, why):
-        """Weed out blacklisted seed entries from a list."""
-        white = []
+    def _outer_blacklist(self, seed, build_tree):
+        """Return the set of packages blacklisted for seed."""
+        if build_tree:
+            supported = self._supported(seed)
+            if supported is None:
+                return frozenset()
+            return supported._blacklist
+        if seed._cache_outer_blacklist is None:
+            blacklist = set()
+            for outerseed in self._outer_seeds(seed):
+                blacklist.update(outerseed._blacklist)
+            seed._cache_outer_blacklist = blacklist
+        return seed._cache_outer_blacklist
+
+    def _report_blacklisted(self, seed, pkg, build_tree, why):
+        """Log which seed blacklists a package that seed tried to add."""
         if build_tree:
             outerseeds = [self._supported(seed)]
         else:
             outerseeds = self._outer_seeds(seed)
+        for outerseed in outerseeds:
+            if outerseed is not None and pkg in outerseed._blacklist:
+                _logger.error("Package %s blacklisted in %s but seeded in %s "
+                              "(%s)", pkg, outerseed, seed, why)
+                break
+        seed._blacklist_seen = True
+
+    def _weed_blacklist(self, pkgs, seed, build_tree, why):
+        """Weed out blacklisted seed entries from a list."""
+        blacklist = self._outer_blacklist(seed, build_tree)
+        if not blacklist:
+            return list(pkgs)
+        white = []
         for pkg in pkgs:
-            for outerseed in outerseeds:
-                if outerseed is not None and pkg in outerseed._blacklist:
-                    _logger.error("Package %s blacklisted in %s but seeded in "
-                                  "%s (%s)", pkg, outerseed, seed, why)
-                    seed._blacklist_seen = True
-                    break
+            if pkg in blacklist:
+                self._report_blacklisted(seed, pkg, build_tree, why)
             else:
                 white.append(pkg)
         return white
@@ -1040,8 +1199,10 @@ class Germinator(object):
             # Check for blacklisted seed entries.
             seed._entries = self._weed_blacklist(
                 seed._entries, seed, False, seed._seed_reason)
+            seed._entries_set = set(seed._entries)
             seed._recommends_entries = self._weed_blacklist(
                 seed._recommends_entries, seed, False, seed._seed_reason)
+            seed._recommends_entries_set = set(seed._recommends_entries)
 
             # Note that seedrecommends are not processed with
             # recommends=True; that is reserved for Recommends of packages,
@@ -1098,15 +1259,21 @@ class Germinator(object):
         self._di_kernel_versions = None
 
         _progress("Identifying extras ...")
-        found = True
-        while found:
-            found = False
-            sorted_srcs = sorted(output._all_srcs)
+        # Adding extras may pull in more sources, whose binaries must be
+        # considered in turn.  A source's binaries never become eligible
+        # after it has been scanned, so each source only needs scanning
+        # once.
+        scanned = set()
+        while True:
+            sorted_srcs = sorted(output._all_srcs - scanned)
+            if not sorted_srcs:
+                break
+            scanned.update(sorted_srcs)
             for srcname in sorted_srcs:
                 for pkg in self._sources[srcname]["Binaries"]:
                     if pkg not in self._packages:
                         continue
-                    if self._packages[pkg]["Source"] != srcname:
+                    if self._packages[pkg].source != srcname:
                         continue
                     if pkg in output._all:
                         continue
@@ -1116,9 +1283,9 @@ class Germinator(object):
                         continue
 
                     seed._entries.append(pkg)
+                    seed._entries_set.add(pkg)
                     self._add_package(seed, pkg, ExtraReason(srcname),
                                       second_class=True)
-                    found = True
 
     def _allowed_dependency(self, pkg, depend, seed, build_depend):
         """Test whether a dependency arc is allowed.
@@ -1130,6 +1297,20 @@ class Germinator(object):
         within any seed.
 
         """
+        key = (pkg, depend, build_depend)
+        allowed = self._allowed_cache.get(key)
+        if allowed is None:
+            allowed = self._allowed_dependency_uncached(
+                pkg, depend, build_depend)
+            self._allowed_cache[key] = allowed
+        if allowed and seed is not None:
+            depname = depend.split(":", 1)[0]
+            if self._is_pruned(self._di_kernel_versions, depname):
+                return False
+        return allowed
+
+    def _allowed_dependency_uncached(self, pkg, depend, build_depend):
+        """Test whether a dependency arc is allowed, ignoring pruning."""
         if ":" in depend:
             depname, depqual = depend.split(":", 1)
         else:
@@ -1139,10 +1320,7 @@ class Germinator(object):
             _logger.warning("_allowed_dependency called with virtual package "
                             "%s", depend)
             return False
-        if (seed is not None and
-            self._is_pruned(self._di_kernel_versions, depname)):
-            return False
-        depmultiarch = self._packages[depname]["Multi-Arch"]
+        depmultiarch = self._packages[depname].multi_arch
         if depqual == "any" and depmultiarch != "allowed":
             return False
         if build_depend:
@@ -1158,8 +1336,8 @@ class Germinator(object):
             if self._packagetype[pkg] == self._packagetype[depname]:
                 # If both packages have a Kernel-Version field, they must
                 # match.
-                pkgkernver = self._packages[pkg]["Kernel-Version"]
-                depkernver = self._packages[depname]["Kernel-Version"]
+                pkgkernver = self._packages[pkg].kernel_version
+                depkernver = self._packages[depname].kernel_version
                 if (pkgkernver != "" and depkernver != "" and
                     pkgkernver != depkernver):
                     return False
@@ -1171,17 +1349,19 @@ class Germinator(object):
                                    seed, build_depend,
                                    always_include_virtual=False):
         """Get the possible candidates for satisfying a dependency."""
+        packages = self._packages
         plain_depname = depname.split(":", 1)[0]
         candidates = []
-        if plain_depname in self._packages:
-            candidates.append(
-                (depname, self._packages[plain_depname]["Version"]))
+        if plain_depname in packages:
+            candidates.append((depname, packages[plain_depname].version))
         if depname in self._provides:
             candidates.extend(self._provides[plain_depname].items())
 
+        version_cache = self._version_cache
+        allowed_dependency = self._allowed_dependency
         for candpkg, candver in candidates:
             plain_candpkg = candpkg.split(":", 1)[0]
-            if plain_candpkg not in self._packages:
+            if plain_candpkg not in packages:
                 continue
             allowed = False
             if deptype == "":
@@ -1192,23 +1372,20 @@ class Germinator(object):
                 # are only satisfied if the depending package is a udeb.
                 allowed = self._packagetype.get(pkg) == "udeb"
             else:
-                compare = apt_pkg.version_compare(candver, depver)
-                if deptype == "<=":
-                    allowed = compare <= 0
-                elif deptype == ">=":
-                    allowed = compare >= 0
-                elif deptype == "<":
-                    allowed = compare < 0
-                elif deptype == ">":
-                    allowed = compare > 0
-                elif deptype == "=":
-                    allowed = compare == 0
-                elif deptype == "!=":
-                    allowed = compare != 0
-                else:
-                    _logger.error("Unknown dependency comparator: %s", deptype)
+                key = (candver, depver, deptype)
+                allowed = version_cache.get(key)
+                if allowed is None:
+                    relation = _dependency_relations.get(deptype)
+                    if relation is None:
+                        _logger.error(
+                            "Unknown dependency comparator: %s", deptype)
+                        allowed = False
+                    else:
+                        allowed = relation(
+                            apt_pkg.version_compare(candver, depver), 0)
+                        version_cache[key] = allowed
             if allowed:
-                if self._allowed_dependency(pkg, candpkg, seed, build_depend):
+                if allowed_dependency(pkg, candpkg, seed, build_depend):
                     yield plain_candpkg
                     if candpkg == depname and not always_include_virtual:
                         break
@@ -1243,60 +1420,73 @@ class Germinator(object):
                 return False
         return "no-follow-build-depends" not in structure.features
 
-    def _add_reverse(self, pkg, field, rdep):
-        """Add a reverse dependency entry."""
-        if "Reverse-Depends" not in self._packages[pkg]:
-            self._packages[pkg]["Reverse-Depends"] = defaultdict(list)
-        self._packages[pkg]["Reverse-Depends"][field].append(rdep)
-
     def reverse_depends(self, structure):
         """Calculate the reverse dependency relationships."""
         output = self._output[structure]
+        packages = self._packages
+        follow_recommends = self._follow_recommends(structure)
+        # Collect reverse dependencies into sets so that each one is only
+        # recorded once, and only sort them at the end.
+        reverse = defaultdict(lambda: defaultdict(set))
+
+        depends_fields = ("Pre-Depends", "Depends")
+        recommends_fields = ("Pre-Depends", "Depends", "Recommends")
 
         for pkg in output._all:
-            fields = ["Pre-Depends", "Depends"]
-            if (self._follow_recommends(structure) or
-                self._packages[pkg]["Section"] == "metapackages"):
-                fields.append("Recommends")
+            info = packages[pkg]
+            if follow_recommends or info.section == "metapackages":
+                fields = recommends_fields
+            else:
+                fields = depends_fields
             for field in fields:
-                for deplist in self._packages[pkg][field]:
+                for deplist in info[field]:
                     for dep in deplist:
                         depname = dep[0].split(":", 1)[0]
                         if depname in output._all and \
                            self._allowed_dependency(pkg, dep[0], None, False):
-                            self._add_reverse(depname, field, pkg)
-
-        for src in output._all_srcs:
-            fields = ()
-            if self._follow_build_depends(structure):
-                fields = BUILD_DEPENDS
-            for field in fields:
-                for deplist in self._sources[src][field]:
-                    for dep in deplist:
-                        depname = dep[0].split(":", 1)[0]
-                        if depname in output._all and \
-                           self._allowed_dependency(src, dep[0], None, True):
-                            self._add_reverse(depname, field, src)
-
-        for pkg in output._all:
-            if "Reverse-Depends" not in self._packages[pkg]:
-                continue
-
-            fields = ["Pre-Depends", "Depends"]
-            if (self._follow_recommends(structure) or
-                self._packages[pkg]["Section"] == "metapackages"):
-                fields.append("Recommends")
-            fields.extend(BUILD_DEPENDS)
-            for field in fields:
-                if field not in self._packages[pkg]["Reverse-Depends"]:
-                    continue
-
-                self._packages[pkg]["Reverse-Depends"][field].sort()
+                            reverse[depname][field].add(pkg)
+
+        if self._follow_build_depends(structure):
+            for src in output._all_srcs:
+                for field in BUILD_DEPENDS:
+                    for deplist in self._sources[src][field]:
+                        for dep in deplist:
+                            depname = dep[0].split(":", 1)[0]
+                            if depname in output._all and \
+                               self._allowed_dependency(
+                                   src, dep[0], None, True):
+                                reverse[depname][field].add(src)
+
+        for pkg, fields in reverse.items():
+            info = packages[pkg]
+            if info.reverse_depends is None:
+                info.reverse_depends = {}
+            for field, rdeps in fields.items():
+                if field in info.reverse_depends:
+                    rdeps.update(info.reverse_depends[field])
+                info.reverse_depends[field] = sorted(rdeps)
 
     def _already_satisfied(self, seed, pkg, depend, build_depend=False,
                            with_build=False):
         """Test whether a dependency has already been satisfied."""
         (depname, depver, deptype) = depend
+        if with_build:
+            inner = self._strictly_inner_union(seed, "_build")
+            own = seed._build
+        else:
+            inner = self._strictly_inner_union(seed, "_not_build")
+            own = seed._not_build
+
+        # Most dependencies are unversioned and on a real package that has
+        # already been added, in which case that package is the first
+        # candidate and there is no need to collect the rest.
+        if (deptype == "" and depname in self._packages and
+                (depname in inner or depname in own or
+                 depname in seed._entries_set or
+                 depname in seed._recommends_entries_set) and
+                self._allowed_dependency(pkg, depname, seed, build_depend)):
+            return True
+
         trylist = list(self._get_dependency_candidates(
             pkg, depname, depver, deptype, seed, build_depend,
             always_include_virtual=True))
@@ -1304,16 +1494,10 @@ class Germinator(object):
             return False
 
         for trydep in trylist:
-            if with_build:
-                for innerseed in self._inner_seeds(seed):
-                    if trydep in innerseed._build:
-                        return True
-            else:
-                for innerseed in self._inner_seeds(seed):
-                    if trydep in innerseed._not_build:
-                        return True
-            if (trydep in seed._entries or
-                trydep in seed._recommends_entries):
+            if trydep in inner or trydep in own:
+                return True
+            if (trydep in seed._entries_set or
+                trydep in seed._recommends_entries_set):
                 return True
         else:
             return False
@@ -1326,7 +1510,7 @@ class Germinator(object):
 
         """
         if build_tree and build_depend:
-            why = BuildDependsReason(self._packages[pkg]["Source"])
+            why = BuildDependsReason(self._packages[pkg].source)
         elif recommends:
             why = RecommendsReason(pkg)
         else:
@@ -1364,17 +1548,18 @@ class Germinator(object):
         if not trylist:
             return False
 
-        lesserseeds = self._strictly_outer_seeds(seed)
         if close:
-            lesserseeds = [l for l in lesserseeds
-                             if seed.name in l._close_seeds]
+            lesserseeds = self._close_strictly_outer_seeds(seed)
+        else:
+            lesserseeds = self._strictly_outer_seeds(seed)
+        inner_seeds = self._inner_seeds
         for trydep in trylist:
             for lesserseed in lesserseeds:
-                if (trydep in lesserseed._entries or
-                    trydep in lesserseed._recommends_entries):
+                if (trydep in lesserseed._entries_set or
+                    trydep in lesserseed._recommends_entries_set):
                     # Has it already been promoted from this seed?
                     already_promoted = False
-                    for innerseed in self._inner_seeds(lesserseed):
+                    for innerseed in inner_seeds(lesserseed):
                         if innerseed.name == lesserseed.name:
                             continue
                         if trydep in innerseed._depends:
@@ -1435,12 +1620,14 @@ class Germinator(object):
             # If the depending package isn't a d-i kernel module but the
             # dependency is, then pick all the modules for other allowed
             # kernel versions too.
-            if (self._packages[pkg]["Kernel-Version"] == "" and
-                self._packages[dependlist[0]]["Kernel-Version"] != ""):
+            packages = self._packages
+            if (packages[pkg].kernel_version == "" and
+                packages[dependlist[0]].kernel_version != ""):
+                di_kernel_versions = self._di_kernel_versions
                 dependlist = [d for d in dependlist
-                              if not self._di_kernel_versions or
-                                 (self._packages[d]["Kernel-Version"] in
-                                  self._di_kernel_versions)]
+                              if not di_kernel_versions or
+                                 (packages[d].kernel_version in
+                                  di_kernel_versions)]
             else:
                 dependlist = [dependlist[0]]
             if dependlist != [depname.split(":", 1)[0]]:
@@ -1464,6 +1651,7 @@ class Germinator(object):
             build_tree = True
         if build_tree:
             second_class = True
+        already_satisfied = self._already_satisfied
         for deplist in depends:
             for dep in deplist:
                 # TODO cjwatson 2008-07-02: At the moment this check will
@@ -1471,7 +1659,7 @@ class Germinator(object):
                 # calling _remember_why with a dependency, so seed._reasons
                 # will be a bit inaccurate. We may need another pass for
                 # Recommends to fix this.
-                if self._already_satisfied(
+                if already_satisfied(
                     seed, pkg, dep, build_depend, second_class):
                     break
             else:
@@ -1531,16 +1719,9 @@ class Germinator(object):
         if self._is_pruned(self._di_kernel_versions, pkg):
             _logger.warning("Pruned %s from %s", pkg, seed)
             return
-        if build_tree:
-            outerseeds = [self._supported(seed)]
-        else:
-            outerseeds = self._outer_seeds(seed)
-        for outerseed in outerseeds:
-            if outerseed is not None and pkg in outerseed._blacklist:
-                _logger.error("Package %s blacklisted in %s but seeded in %s "
-                              "(%s)", pkg, outerseed, seed, why)
-                seed._blacklist_seen = True
-                return
+        if pkg in self._outer_blacklist(seed, build_tree):
+            self._report_blacklisted(seed, pkg, build_tree, why)
+            return
         if build_tree:
             second_class = True
 
@@ -1549,17 +1730,11 @@ class Germinator(object):
         if pkg not in output._all:
             output._all.add(pkg)
 
-        for innerseed in self._inner_seeds(seed):
-            if pkg in innerseed._build:
-                break
-        else:
+        if pkg not in self._strictly_inner_union(seed, "_build"):
             seed._build.add(pkg)
 
         if not build_tree:
-            for innerseed in self._inner_seeds(seed):
-                if pkg in innerseed._not_build:
-                    break
-            else:
+            if pkg not in self._strictly_inner_union(seed, "_not_build"):
                 seed._not_build.add(pkg)
 
         # Remember why the package was added to the output for this seed.
@@ -1569,35 +1744,39 @@ class Germinator(object):
         self._remember_why(output._all_reasons, pkg, why, build_tree,
                            recommends)
 
-        for prov in self._packages[pkg]["Provides"]:
-            seed._pkgprovides[prov[0][0]].add(pkg)
+        info = self._packages[pkg]
+        sources = self._sources
+        add_dependency_tree = self._add_dependency_tree
+        pkgprovides = seed._pkgprovides
+        for prov in info.provides:
+            pkgprovides[prov[0][0]].add(pkg)
 
-        self._add_dependency_tree(seed, pkg,
-                                  self._packages[pkg]["Pre-Depends"],
-                                  second_class=second_class,
-                                  build_tree=build_tree)
+        add_dependency_tree(seed, pkg,
+                            info.pre_depends,
+                            second_class=second_class,
+                            build_tree=build_tree)
 
-        self._add_dependency_tree(seed, pkg,
-                                  self._packages[pkg]["Depends"],
-                                  second_class=second_class,
-                                  build_tree=build_tree)
+        add_dependency_tree(seed, pkg,
+                            info.depends,
+                            second_class=second_class,
+                            build_tree=build_tree)
 
         if (self._follow_recommends(seed.structure, seed) or
-            self._packages[pkg]["Section"] == "metapackages"):
-            self._add_dependency_tree(seed, pkg,
-                                      self._packages[pkg]["Recommends"],
-                                      second_class=second_class,
-                                      build_tree=build_tree,
-                                      recommends=True)
+            info.section == "metapackages"):
+            add_dependency_tree(seed, pkg,
+                                info.recommends,
+                                second_class=second_class,
+                                build_tree=build_tree,
+                                recommends=True)
 
-        src = self._packages[pkg]["Source"]
+        src = info.source
 
         # Built-Using field is in a form of apt_pkg.parse_depends For
         # common-case "pkg (= 1)" it returns
         #     [[('pkg', '1', '=')]]
         # We thus unpack the first listed alternative pkg-name, for
         # each built-using source.
-        built_using = [i[0][0] for i in self._packages[pkg]["Built-Using"]]
+        built_using = [i[0][0] for i in info.built_using]
         pkg_srcs = []
 
         if second_class:
@@ -1605,15 +1784,15 @@ class Germinator(object):
         else:
             excluded_srcs = "_not_build_srcs"
 
+        inner_srcs = self._strictly_inner_union(seed, excluded_srcs)
+        own_srcs = getattr(seed, excluded_srcs)
+
         # Create set of all sources needed for pkg: Source + Built-Using
         for pkg_src in built_using + [src]:
-            if pkg_src in self._sources and pkg_src not in pkg_srcs:
+            if pkg_src in sources and pkg_src not in pkg_srcs:
                 # Consider this source unless it is already part of an inner
                 # seed
-                for innerseed in self._inner_seeds(seed):
-                    if pkg_src in getattr(innerseed, excluded_srcs):
-                        break
-                else:
+                if pkg_src not in inner_srcs and pkg_src not in own_srcs:
                     pkg_srcs.append(pkg_src)
             else:
                 _logger.error("Missing source package: %s (for %s)", pkg_src, pkg)
@@ -1632,11 +1811,17 @@ class Germinator(object):
             output._all_srcs.add(pkg_src)
             seed._build_srcs.add(pkg_src)
 
-            if self._follow_build_depends(seed.structure, seed):
+            # Only follow build-dependencies of each source once per seed.
+            # The d-i kernel version restrictions can differ between seed
+            # entries, so always follow them again while those apply.
+            if (pkg_src not in seed._followed_build_srcs and
+                self._follow_build_depends(seed.structure, seed)):
+                if not self._di_kernel_versions:
+                    seed._followed_build_srcs.add(pkg_src)
+                src_info = sources[pkg_src]
                 for build_depends in BUILD_DEPENDS:
-                    self._add_dependency_tree(seed, pkg,
-                                              self._sources[pkg_src][build_depends],
-                                              build_depend=True)
+                    add_dependency_tree(seed, pkg, src_info[build_depends],
+                                        build_depend=True)
 
 
     def _rescue_includes(self, structure, seedname, rescue_seedname,
@@ -1681,8 +1866,9 @@ class Germinator(object):
                 if pkg in output._all:
                     continue
                 for lesserseed in self._strictly_outer_seeds(seed):
-                    if pkg in lesserseed._entries:
+                    if pkg in lesserseed._entries_set:
                         seed._entries.remove(pkg)
+                        seed._entries_set.discard(pkg)
                         _logger.warning("Promoted %s from %s to %s due to "
                                         "%s-Includes",
                                         pkg, lesserseed, seed,
@@ -1702,11 +1888,11 @@ class Germinator(object):
 
     def get_source(self, pkg):
         """Return the name of the source package that builds pkg."""
-        return self._packages[pkg]["Source"]
+        return self._packages[pkg].source
 
     def is_essential(self, pkg):
         """Test whether pkg is Essential."""
-        return self._packages[pkg].get("Essential", "no") == "yes"
+        return self._packages[pkg].essential == "yes"
 
     def _get_seed(self, structure, seedname):
         """Return the GerminatedSeed for this structure and seed name."""
@@ -1806,113 +1992,84 @@ class Germinator(object):
     # ------------------------------------
 
     def _write_list(self, reasons, filename, pkgset):
-        pkglist = sorted(pkgset)
-
-        pkg_len = len("Package")
-        src_len = len("Source")
-        why_len = len("Why")
-        mnt_len = len("Maintainer")
-
-        for pkg in pkglist:
-            _pkg_len = len(pkg)
-            if _pkg_len > pkg_len:
-                pkg_len = _pkg_len
-
-            _src_len = len(self._packages[pkg]["Source"])
-            if _src_len > src_len:
-                src_len = _src_len
-
-            why = reasons[pkg][0] if pkg in reasons else ""
-            _why_len = len(str(why))
-            if _why_len > why_len:
-                why_len = _why_len
-
-            _mnt_len = len(self._packages[pkg]["Maintainer"])
-            if _mnt_len > mnt_len:
-                mnt_len = _mnt_len
-
-        size = 0
-        installed_size = 0
+        packages = self._packages
+        rows = []
+        for pkg in sorted(pkgset):
+            info = packages[pkg]
+            why = str(reasons[pkg][0]) if pkg in reasons else ""
+            rows.append((pkg, info.source, why, info.maintainer,
+                         info.size, info.installed_size))
+
+        pkg_len = max([len("Package")] + [len(row[0]) for row in rows])
+        src_len = max([len("Source")] + [len(row[1]) for row in rows])
+        why_len = max([len("Why")] + [len(row[2]) for row in rows])
+        mnt_len = max([len("Maintainer")] + [len(row[3]) for row in rows])
+        size = sum(row[4] for row in rows)
+        installed_size = sum(row[5] for row in rows)
+
+        row_fmt = "%%-%ds | %%-%ds | %%-%ds | %%-%ds | %%15d | %%15d\n" % (
+            pkg_len, src_len, why_len, mnt_len)
+        lines = [
+            "%-*s | %-*s | %-*s | %-*s | %-15s | %-15s\n" %
+            (pkg_len, "Package",
+             src_len, "Source",
+             why_len, "Why",
+             mnt_len, "Maintainer",
+             "Deb Size (B)",
+             "Inst Size (KB)"),
+            ("-" * pkg_len) + "-+-" + ("-" * src_len) + "-+-"
+            + ("-" * why_len) + "-+-" + ("-" * mnt_len) + "-+-"
+            + ("-" * 15) + "-+-" + ("-" * 15) + "-\n",
+        ]
+        lines.extend(row_fmt % row for row in rows)
+        lines.append(
+            ("-" * (pkg_len + src_len + why_len + mnt_len + 9))
+            + "-+-" + ("-" * 15) + "-+-" + ("-" * 15) + "-\n")
+        lines.append(
+            "%*s | %15d | %15d\n" %
+            ((pkg_len + src_len + why_len + mnt_len + 9), "",
+             size, installed_size))
 
         with AtomicFile(filename) as f:
-            print("%-*s | %-*s | %-*s | %-*s | %-15s | %-15s" %
-                  (pkg_len, "Package",
-                   src_len, "Source",
-                   why_len, "Why",
-                   mnt_len, "Maintainer",
-                   "Deb Size (B)",
-                   "Inst Size (KB)"), file=f)
-            print(("-" * pkg_len) + "-+-" + ("-" * src_len) + "-+-"
-                  + ("-" * why_len) + "-+-" + ("-" * mnt_len) + "-+-"
-                  + ("-" * 15) + "-+-" + ("-" * 15) + "-", file=f)
-            for pkg in pkglist:
-                why = reasons[pkg][0] if pkg in reasons else ""
-                size += self._packages[pkg]["Size"]
-                installed_size += self._packages[pkg]["Installed-Size"]
-                print("%-*s | %-*s | %-*s | %-*s | %15d | %15d" %
-                      (pkg_len, pkg,
-                       src_len, self._packages[pkg]["Source"],
-                       why_len, why,
-                       mnt_len, self._packages[pkg]["Maintainer"],
-                       self._packages[pkg]["Size"],
-                       self._packages[pkg]["Installed-Size"]), file=f)
-            print(("-" * (pkg_len + src_len + why_len + mnt_len + 9))
-                  + "-+-" + ("-" * 15) + "-+-" + ("-" * 15) + "-", file=f)
-            print("%*s | %15d | %15d" %
-                  ((pkg_len + src_len + why_len + mnt_len + 9), "",
-                   size, installed_size), file=f)
+            f.write("".join(lines))
 
     def _write_source_list(self, filename, srcset):
         srclist = sorted(srcset)
+        maintainers = [self._sources[src]["Maintainer"] for src in srclist]
 
-        src_len = len("Source")
-        mnt_len = len("Maintainer")
-
-        for src in srclist:
-            _src_len = len(src)
-            if _src_len > src_len:
-                src_len = _src_len
+        src_len = max([len("Source")] + [len(src) for src in srclist])
+        mnt_len = max([len("Maintainer")] + [len(mnt) for mnt in maintainers])
 
-            _mnt_len = len(self._sources[src]["Maintainer"])
-            if _mnt_len > mnt_len:
-                mnt_len = _mnt_len
+        fmt = "%-*s | %-*s\n"
+        lines = [
+            fmt % (src_len, "Source", mnt_len, "Maintainer"),
+            ("-" * src_len) + "-+-" + ("-" * mnt_len) + "-\n",
+        ]
+        for src, mnt in zip(srclist, maintainers):
+            lines.append(fmt % (src_len, src, mnt_len, mnt))
 
         with AtomicFile(filename) as f:
-            fmt = "%-*s | %-*s"
-
-            print(fmt % (src_len, "Source", mnt_len, "Maintainer"), file=f)
-            print(("-" * src_len) + "-+-" + ("-" * mnt_len) + "-", file=f)
-            for src in srclist:
-                print(fmt % (src_len, src, mnt_len,
-                             self._sources[src]["Maintainer"]), file=f)
+            f.write("".join(lines))
 
     def _write_snap_list(self, reasons, filename, snapset):
-        snaplist = sorted(snapset)
-
-        pkg_len = len("Package")
-        why_len = len("Why")
-
-        for pkg in snaplist:
-            _pkg_len = len(pkg)
-            if _pkg_len > pkg_len:
-                pkg_len = _pkg_len
-
-            why = reasons[pkg][0] if pkg in reasons else ""
-            _why_len = len(str(why))
-            if _why_len > why_len:
-                why_len = _why_len
+        rows = []
+        for pkg in sorted(snapset):
+            why = str(reasons[pkg][0]) if pkg in reasons else ""
+            rows.append((pkg, why))
+
+        pkg_len = max([len("Package")] + [len(row[0]) for row in rows])
+        why_len = max([len("Why")] + [len(row[1]) for row in rows])
+
+        lines = [
+            "%-*s | %-*s\n" % (pkg_len, "Package", why_len, "Why"),
+            ("-" * pkg_len) + "-+-" + ("-" * why_len) + "\n",
+        ]
+        for pkg, why in rows:
+            lines.append("%-*s | %-*s\n" % (pkg_len, pkg, why_len, why))
+        lines.append(("-" * (pkg_len + why_len + 3)) + "\n")
 
         with AtomicFile(filename) as f:
-            print("%-*s | %-*s" %
-                  (pkg_len, "Package",
-                   why_len, "Why"), file=f)
-            print(("-" * pkg_len) + "-+-" + ("-" * why_len), file=f)
-            for pkg in snaplist:
-                why = reasons[pkg][0] if pkg in reasons else ""
-                print("%-*s | %-*s" %
-                      (pkg_len, pkg,
-                       why_len, why), file=f)
-            print(("-" * (pkg_len + why_len + 3)), file=f)
+            f.write("".join(lines))
 
     def write_full_list(self, structure, filename, seedname):
         """Write the full (run-time) dependency expansion of this seed."""
@@ -1999,18 +2156,19 @@ class Germinator(object):
         """Write the "supported+build-depends" list."""
         sup_bins = set()
 
+        # Only include those build-dependencies that aren't already in the
+        # dependency outputs for inner seeds of supported. This allows
+        # supported+build-depends to be usable as an "everything else"
+        # output.
+        inner_bins = set()
+        for innerseedname in structure.inner_seeds(structure.supported):
+            inner_bins |= self.get_full(structure, innerseedname)
+
         for seedname in structure.names:
             if seedname == structure.supported:
                 sup_bins |= self.get_full(structure, seedname)
 
-            # Only include those build-dependencies that aren't already in
-            # the dependency outputs for inner seeds of supported. This
-            # allows supported+build-depends to be usable as an "everything
-            # else" output.
-            build_depends = set(self.get_build_depends(structure, seedname))
-            for innerseedname in structure.inner_seeds(structure.supported):
-                build_depends -= self.get_full(structure, innerseedname)
-            sup_bins |= build_depends
+            sup_bins |= self.get_build_depends(structure, seedname) - inner_bins
 
         self._write_list(self._output[structure]._all_reasons, filename,
                          sup_bins)
@@ -2019,20 +2177,21 @@ class Germinator(object):
         """Write the "supported+build-depends" sources list."""
         sup_srcs = set()
 
+        # Only include those build-dependencies that aren't already in the
+        # dependency outputs for inner seeds of supported. This allows
+        # supported+build-depends to be usable as an "everything else"
+        # output.
+        inner_srcs = set()
+        for innerseedname in structure.inner_seeds(structure.supported):
+            inner_srcs |= self._get_seed(structure, innerseedname)._sourcepkgs
+
         for seedname in structure.names:
             seed = self._get_seed(structure, seedname)
 
             if seedname == structure.supported:
                 sup_srcs |= seed._sourcepkgs
 
-            # Only include those build-dependencies that aren't already in
-            # the dependency outputs for inner seeds of supported. This
-            # allows supported+build-depends to be usable as an "everything
-            # else" output.
-            build_sourcepkgs = set(seed._build_sourcepkgs)
-            for innerseed in self._inner_seeds(self._supported(seed)):
-                build_sourcepkgs -= innerseed._sourcepkgs
-            sup_srcs |= build_sourcepkgs
+            sup_srcs |= seed._build_sourcepkgs - inner_srcs
 
         self._write_source_list(filename, sup_srcs)
 
@@ -2053,30 +2212,31 @@ class Germinator(object):
         if output._rdepends_cache_entries is None:
             cache_entries = {}
             for seedname in output._seednames:
-                cache_entries[seedname] = self.get_seed_entries(
-                    structure, seedname)
+                cache_entries[seedname] = set(self.get_seed_entries(
+                    structure, seedname))
             output._rdepends_cache_entries = cache_entries
 
         # Then write out the list itself.
+        lines = [pkg + "\n"]
+        self._write_rdepend_list(structure, lines, pkg, "", done=set())
         with AtomicFile(filename) as f:
-            print(pkg, file=f)
-            self._write_rdepend_list(structure, f, pkg, "", done=set())
+            f.write("".join(lines))
 
-    def _write_rdepend_list(self, structure, f, pkg, prefix, stack=None,
+    def _write_rdepend_list(self, structure, lines, pkg, prefix, stack=None,
                             done=None):
         if stack is None:
             stack = []
         else:
             stack = list(stack)
             if pkg in stack:
-                print(prefix + "! loop", file=f)
+                lines.append(prefix + "! loop\n")
                 return
         stack.append(pkg)
 
         if done is None:
             done = set()
         elif pkg in done:
-            print(prefix + "! skipped", file=f)
+            lines.append(prefix + "! skipped\n")
             return
         done.add(pkg)
 
@@ -2084,46 +2244,49 @@ class Germinator(object):
         cache_entries = output._rdepends_cache_entries
         for seedname in output._seednames:
             if pkg in cache_entries[seedname]:
-                print(prefix + "*", seedname.title(), "seed", file=f)
+                lines.append("%s* %s seed\n" % (prefix, seedname.title()))
 
-        if "Reverse-Depends" not in self._packages[pkg]:
+        reverse_depends = self._packages[pkg].reverse_depends
+        if reverse_depends is None:
             return
 
         for field in ("Pre-Depends", "Depends", "Recommends") + BUILD_DEPENDS:
-            if field not in self._packages[pkg]["Reverse-Depends"]:
+            if field not in reverse_depends:
                 continue
 
-            i = 0
-            print(prefix + "*", "Reverse", field + ":", file=f)
-            for dep in self._packages[pkg]["Reverse-Depends"][field]:
-                i += 1
-                print(prefix + " +- " + dep, file=f)
+            rdeps = reverse_depends[field]
+            lines.append("%s* Reverse %s:\n" % (prefix, field))
+            for i, dep in enumerate(rdeps, 1):
+                lines.append(prefix + " +- " + dep + "\n")
                 if field.startswith("Build-"):
                     continue
 
-                if i == len(self._packages[pkg]["Reverse-Depends"][field]):
+                if i == len(rdeps):
                     extra = "    "
                 else:
                     extra = " |  "
-                self._write_rdepend_list(structure, f, dep, prefix + extra,
-                                         stack, done)
+                self._write_rdepend_list(structure, lines, dep,
+                                         prefix + extra, stack, done)
 
     def write_provides_list(self, structure, filename):
         """Write a summary of which packages satisfied Provides."""
         output = self._output[structure]
 
+        all_pkgprovides = defaultdict(set)
+        for seedname in output._seednames:
+            seed = self._get_seed(structure, seedname)
+            for prov, provset in seed._pkgprovides.items():
+                all_pkgprovides[prov].update(provset)
+
+        lines = []
+        for prov in sorted(all_pkgprovides):
+            lines.append(prov + "\n")
+            for pkg in sorted(all_pkgprovides[prov]):
+                lines.append("\t%s\n" % (pkg,))
+            lines.append("\n")
+
         with AtomicFile(filename) as f:
-            all_pkgprovides = defaultdict(set)
-            for seedname in output._seednames:
-                seed = self._get_seed(structure, seedname)
-                for prov, provset in seed._pkgprovides.items():
-                    all_pkgprovides[prov].update(provset)
-
-            for prov in sorted(all_pkgprovides):
-                print(prov, file=f)
-                for pkg in sorted(all_pkgprovides[prov]):
-                    print("\t%s" % (pkg,), file=f)
-                print(file=f)
+            f.write("".join(lines))
 
     def write_blacklisted(self, structure, filename):
         """Write the list of blacklisted packages we encountered."""
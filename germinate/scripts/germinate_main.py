@@ -25,6 +25,7 @@ import optparse
 import os
 import shutil
 import sys
+import threading
 
 import germinate.archive
 import germinate.defaults
@@ -98,6 +99,11 @@ def parse_options(argv):
     parser.add_option('--cleanup', dest='cleanup', action='store_true',
                       default=False,
                       help="don't cache Packages or Sources files")
+    parser.add_option('--cache', dest='cache', action='store_true',
+                      default=False,
+                      help="cache Packages, Sources and seed files in "
+                           "$XDG_CACHE_HOME rather than the current "
+                           "directory")
     parser.add_option('--no-rdepends', dest='want_rdepends',
                       action='store_false', default=True,
                       help='disable reverse-dependency calculations')
@@ -137,6 +143,44 @@ def parse_options(argv):
     return options
 
 
+if sys.version >= '3':
+    def _reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
+else:
+    exec("def _reraise(exc_info):\n"
+         "    raise exc_info[0], exc_info[1], exc_info[2]\n")
+
+
+class _SeedStructureLoader(threading.Thread):
+    """Fetch and parse a seed structure in the background."""
+
+    def __init__(self, *args, **kwargs):
+        super(_SeedStructureLoader, self).__init__()
+        self.daemon = True
+        self._args = args
+        self._kwargs = kwargs
+        self._structure = None
+        self._exc_info = None
+
+    def run(self):
+        try:
+            self._structure = SeedStructure(*self._args, **self._kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def result(self):
+        """Wait for the structure, re-raising any error from loading it.
+
+        The error keeps its original traceback, so it points at the
+        failing seed code rather than at this method.
+        """
+        self.join()
+        if self._exc_info is not None:
+            exc_info, self._exc_info = self._exc_info, None
+            _reraise(exc_info)
+        return self._structure
+
+
 def main(argv):
     options = parse_options(argv)
 
@@ -145,13 +189,26 @@ def main(argv):
     else:
         germinate_logging(logging.INFO)
 
+    seed_cache = options.cache and not options.cleanup
+    if options.vcs is None:
+        # Fetching seeds from URLs and fetching the archive are independent
+        # downloads, so fetch the seeds while the archive is being parsed.
+        # VCS checkouts are left until afterwards, as before, so that their
+        # output and errors are not mixed up with the archive's.
+        loader = _SeedStructureLoader(options.release, options.seeds,
+                                      cache=seed_cache)
+        loader.start()
+    else:
+        loader = None
+
     g = Germinator(options.arch)
     g._always_follow_build_depends = options.always_follow_build_depends
 
     archive = germinate.archive.TagFile(
         options.dist, options.components, options.arch,
         options.mirrors, source_mirrors=options.source_mirrors,
-        installer_packages=options.installer, cleanup=options.cleanup)
+        installer_packages=options.installer, cleanup=options.cleanup,
+        cache=options.cache, cache_sections=options.cache)
     g.parse_archive(archive)
 
     if os.path.isfile("hints"):
@@ -159,7 +216,11 @@ def main(argv):
             g.parse_hints(hints)
 
     try:
-        structure = SeedStructure(options.release, options.seeds, options.vcs)
+        if loader is not None:
+            structure = loader.result()
+        else:
+            structure = SeedStructure(options.release, options.seeds,
+                                      options.vcs, cache=seed_cache)
         for seed_package in options.seed_packages:
             parent, pkg = seed_package.split('/')
             structure.add(pkg, [" * " + pkg], parent)
@@ -215,15 +276,35 @@ def main(argv):
         shutil.rmtree("rdepends")
     if options.want_rdepends:
         os.mkdir("rdepends")
-        os.mkdir(os.path.join("rdepends", "ALL"))
-        for pkg in g.get_all(structure):
-            dirname = os.path.join("rdepends", g.get_source(pkg))
-            if not os.path.exists(dirname):
-                os.mkdir(dirname)
-
-            g.write_rdepend_list(structure, os.path.join(dirname, pkg), pkg)
-            os.symlink(os.path.join("..", g.get_source(pkg), pkg),
-                       os.path.join("rdepends", "ALL", pkg))
+        all_dirname = os.path.join("rdepends", "ALL")
+        os.mkdir(all_dirname)
+        # Create the links relative to an open directory where possible,
+        # rather than looking up its path again for each one.
+        if os.symlink in getattr(os, "supports_dir_fd", ()):
+            all_fd = os.open(all_dirname, os.O_RDONLY | os.O_DIRECTORY)
+        else:
+            all_fd = None
+        try:
+            # rdepends was created empty above, so we know which source
+            # directories exist without asking the filesystem.
+            made_dirs = set(["ALL"])
+            for pkg in g.get_all(structure):
+                src = g.get_source(pkg)
+                dirname = os.path.join("rdepends", src)
+                if src not in made_dirs:
+                    os.mkdir(dirname)
+                    made_dirs.add(src)
+
+                g.write_rdepend_list(structure, os.path.join(dirname, pkg),
+                                     pkg)
+                target = os.path.join("..", src, pkg)
+                if all_fd is not None:
+                    os.symlink(target, pkg, dir_fd=all_fd)
+                else:
+                    os.symlink(target, os.path.join(all_dirname, pkg))
+        finally:
+            if all_fd is not None:
+                os.close(all_fd)
 
     g.write_blacklisted(structure, "blacklisted")
 
@@ -112,6 +112,11 @@ class Globals:
             sys.exit(1)
         g.grow(structure)
 
+        if build_tree:
+            inner_bins = set()
+            for inner in structure.inner_seeds(structure.supported):
+                inner_bins |= g.get_full(structure, inner)
+
         for seedname in structure.names:
             for pkg in g.get_seed_entries(structure, seedname):
                 self.package.setdefault(pkg, Package(pkg))
@@ -124,12 +129,8 @@ class Globals:
                 self.package[pkg].set_seed(seedname + ".depends")
 
             if build_tree:
-                build_depends = set(g.get_build_depends(structure, seedname))
-                for inner in structure.inner_seeds(structure.supported):
-                    build_depends -= set(g.get_seed_entries(structure, inner))
-                    build_depends -= set(g.get_seed_recommends_entries(
-                        structure, inner))
-                    build_depends -= g.get_depends(structure, inner)
+                build_depends = (
+                    g.get_build_depends(structure, seedname) - inner_bins)
                 for pkg in build_depends:
                     self.package.setdefault(pkg, Package(pkg))
                     self.package[pkg].set_seed(structure.supported +
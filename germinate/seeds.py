@@ -23,14 +23,19 @@ from __future__ import print_function
 import atexit
 import codecs
 import collections
+from email.utils import formatdate, mktime_tz, parsedate_tz
+import hashlib
 import io
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 try:
     from urllib.parse import urljoin, urlparse as _urlparse
     from urllib.request import Request, URLError, urlopen
@@ -38,6 +43,19 @@ except ImportError:
     from urlparse import urljoin, urlparse as _urlparse
     from urllib2 import Request, URLError, urlopen
 
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from germinate.cache import (
+    cache_home,
+    get_session,
+    part_name,
+    prune_cache,
+    replace,
+    touch,
+    )
 import germinate.defaults
 from germinate.tsort import topo_sort
 
@@ -58,6 +76,26 @@ _logger = logging.getLogger(__name__)
 
 
 _vcs_cache_dir = None
+_vcs_cache_lock = threading.Lock()
+
+
+def _get_vcs_cache_dir():
+    """Return the temporary directory holding VCS checkouts of seeds."""
+    global _vcs_cache_dir
+    with _vcs_cache_lock:
+        if _vcs_cache_dir is None:
+            _vcs_cache_dir = tempfile.mkdtemp(prefix='germinate-')
+            atexit.register(
+                shutil.rmtree, _vcs_cache_dir, ignore_errors=True)
+        return _vcs_cache_dir
+
+
+# Maximum number of seeds to download from a URL collection at once.
+_max_fetch_workers = 8
+
+
+# Extracts the host name from a VCS-over-SSH seed base.
+_ssh_base_re = re.compile(r'(?:bzr|git)\+ssh://(?:[^/]*?@)?(.*?)(?:/|$)')
 
 
 if sys.version >= '3':
@@ -102,11 +140,14 @@ class SeedError(RuntimeError):
     pass
 
 
+_utf8_decode = codecs.getdecoder("UTF-8")
+
+
 def _ensure_unicode(s):
     if isinstance(s, _text_type):
         return s
     else:
-        return _text_type(s, "utf8", "replace")
+        return _utf8_decode(s, "replace")[0]
 
 
 class SeedVcs(object):
@@ -122,69 +163,131 @@ class SeedVcs(object):
     GIT = 3
 
 
+def _seed_cache_dir():
+    """Return the directory in which downloaded seeds are cached."""
+    return os.path.join(cache_home(), "germinate", "seeds")
+
+
+def _seed_cache_path(url):
+    """Return the path of the cached copy of the seed at url."""
+    dirname = _seed_cache_dir()
+    if not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # Another thread may have created it first.
+            if not os.path.isdir(dirname):
+                raise
+    return os.path.join(
+        dirname, hashlib.sha1(url.encode("UTF-8")).hexdigest())
+
+
+def _write_seed_cache(path, response):
+    """Save a downloaded seed and its validators for later revalidation."""
+    etagname = path + ".etag"
+    try:
+        partname = part_name(path)
+        try:
+            with open(partname, "wb") as f:
+                f.write(response.content)
+            last_modified = response.headers.get("Last-Modified")
+            if last_modified is not None:
+                last_modified = parsedate_tz(last_modified)
+            if last_modified is not None:
+                os.utime(partname, (time.time(), mktime_tz(last_modified)))
+            replace(partname, path)
+        finally:
+            if os.path.exists(partname):
+                os.unlink(partname)
+
+        etag = response.headers.get("ETag")
+        if etag is not None:
+            partname = part_name(etagname)
+            with open(partname, "w") as f:
+                print(etag, file=f)
+            replace(partname, etagname)
+        elif os.path.exists(etagname):
+            os.unlink(etagname)
+    except (OSError, IOError) as e:
+        _logger.warning("Could not cache %s: %s", path, e)
+
+
+def _checkout_bzr(base, branch):
+    """Check out a bzr seed branch if necessary, returning its path."""
+    checkout = os.path.join(_get_vcs_cache_dir(), branch)
+    if not os.path.isdir(checkout):
+        path = os.path.join(base, branch)
+        if not path.endswith('/'):
+            path += '/'
+        command = ['bzr']
+        # https://bugs.launchpad.net/bzr/+bug/39542
+        if path.startswith('http:'):
+            command.append('branch')
+            _logger.info("Fetching branch of %s", path)
+        else:
+            command.extend(['checkout', '--lightweight'])
+            _logger.info("Checking out %s", path)
+        command.extend([path, checkout])
+        status = subprocess.call(command)
+        if status != 0:
+            raise SeedError("Command failed with exit status %d:\n"
+                            "  '%s'" % (status, ' '.join(command)))
+    return checkout
+
+
+def _checkout_git(base, branch):
+    """Clone a git seed branch if necessary, returning its path."""
+    checkout = os.path.join(_get_vcs_cache_dir(), branch)
+    if not os.path.isdir(checkout):
+        # This is a very strange way to specify a git branch, but it's hard
+        # to do better here without breaking backward-compatibility in at
+        # least some of Germinate's own command-line arguments, the public
+        # Python API, or "include" lines in seed STRUCTURE files.
+        if '.' in branch:
+            repository, git_branch = branch.rsplit('.', 1)
+        else:
+            repository = branch
+            git_branch = None
+        path = os.path.join(base, repository)
+        if not path.endswith('/'):
+            path += '/'
+        command = ['git', 'clone']
+        if git_branch is not None:
+            command.extend(['-b', git_branch])
+            _logger.info("Cloning branch %s of %s", git_branch, path)
+        else:
+            _logger.info("Cloning %s", path)
+        command.extend([path, checkout])
+        status = subprocess.call(command)
+        if status != 0:
+            raise SeedError("Command failed with exit status %d:\n"
+                            "  '%s'" % (status, ' '.join(command)))
+    return checkout
+
+
+def _checkout(base, branch, vcs):
+    """Make a local checkout of a seed branch, returning its path."""
+    if vcs == SeedVcs.AUTO:
+        # Slightly dodgy auto-sensing, but if we can't tell then we'll try
+        # both.
+        if base.startswith('git'):
+            vcs = SeedVcs.GIT
+        elif base.startswith('bzr'):
+            vcs = SeedVcs.BZR
+    if vcs == SeedVcs.AUTO:
+        try:
+            return _checkout_git(base, branch)
+        except SeedError:
+            return _checkout_bzr(base, branch)
+    elif vcs == SeedVcs.GIT:
+        return _checkout_git(base, branch)
+    else:
+        return _checkout_bzr(base, branch)
+
+
 class Seed(object):
     """A single seed from a collection."""
 
-    def _open_seed_bzr(self, base, branch, name):
-        global _vcs_cache_dir
-        if _vcs_cache_dir is None:
-            _vcs_cache_dir = tempfile.mkdtemp(prefix='germinate-')
-            atexit.register(
-                shutil.rmtree, _vcs_cache_dir, ignore_errors=True)
-        checkout = os.path.join(_vcs_cache_dir, branch)
-        if not os.path.isdir(checkout):
-            path = os.path.join(base, branch)
-            if not path.endswith('/'):
-                path += '/'
-            command = ['bzr']
-            # https://bugs.launchpad.net/bzr/+bug/39542
-            if path.startswith('http:'):
-                command.append('branch')
-                _logger.info("Fetching branch of %s", path)
-            else:
-                command.extend(['checkout', '--lightweight'])
-                _logger.info("Checking out %s", path)
-            command.extend([path, checkout])
-            status = subprocess.call(command)
-            if status != 0:
-                raise SeedError("Command failed with exit status %d:\n"
-                                "  '%s'" % (status, ' '.join(command)))
-        return open(os.path.join(checkout, name))
-
-    def _open_seed_git(self, base, branch, name):
-        global _vcs_cache_dir
-        if _vcs_cache_dir is None:
-            _vcs_cache_dir = tempfile.mkdtemp(prefix='germinate-')
-            atexit.register(
-                shutil.rmtree, _vcs_cache_dir, ignore_errors=True)
-        checkout = os.path.join(_vcs_cache_dir, branch)
-        if not os.path.isdir(checkout):
-            # This is a very strange way to specify a git branch, but it's
-            # hard to do better here without breaking backward-compatibility
-            # in at least some of Germinate's own command-line arguments,
-            # the public Python API, or "include" lines in seed STRUCTURE
-            # files.
-            if '.' in branch:
-                repository, git_branch = branch.rsplit('.', 1)
-            else:
-                repository = branch
-                git_branch = None
-            path = os.path.join(base, repository)
-            if not path.endswith('/'):
-                path += '/'
-            command = ['git', 'clone']
-            if git_branch is not None:
-                command.extend(['-b', git_branch])
-                _logger.info("Cloning branch %s of %s", git_branch, path)
-            else:
-                _logger.info("Cloning %s", path)
-            command.extend([path, checkout])
-            status = subprocess.call(command)
-            if status != 0:
-                raise SeedError("Command failed with exit status %d:\n"
-                                "  '%s'" % (status, ' '.join(command)))
-        return open(os.path.join(checkout, name))
-
     def _open_seed_url(self, base, branch, name):
         path = os.path.join(base, branch)
         if not path.endswith('/'):
@@ -195,34 +298,56 @@ class Seed(object):
             _logger.info("Using %s", fullpath)
             return open(fullpath)
         _logger.info("Downloading %s", url)
+        headers = {'Cache-Control': 'no-cache', 'Pragma': 'no-cache'}
+        session = get_session()
+        if session is not None and url.startswith(('http:', 'https:')):
+            # Reuse connections to the seed server across seeds.  Seeds are
+            # small, so read the whole response to release the connection
+            # back to the pool straight away.
+            cache_path = None
+            if self._cache:
+                cache_path = _seed_cache_path(url)
+                if os.path.exists(cache_path):
+                    # Revalidate the cached copy, and only download it
+                    # again if it has changed.
+                    headers['If-Modified-Since'] = formatdate(
+                        os.stat(cache_path).st_mtime, usegmt=True)
+                    try:
+                        with open(cache_path + ".etag") as etag_f:
+                            headers['If-None-Match'] = etag_f.read().strip()
+                    except IOError:
+                        pass
+            try:
+                response = session.get(url, headers=headers)
+                if response.status_code == 304 and cache_path is not None:
+                    _logger.debug("Using cached %s", url)
+                    # Record the use, so that pruning keeps it.
+                    touch(cache_path)
+                    touch(cache_path + ".etag")
+                    return open(cache_path, "rb")
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise IOError(str(e))
+            if cache_path is not None:
+                _write_seed_cache(cache_path, response)
+            return io.BytesIO(response.content)
         req = Request(url)
-        req.add_header('Cache-Control', 'no-cache')
-        req.add_header('Pragma', 'no-cache')
+        for header, value in headers.items():
+            req.add_header(header, value)
         return urlopen(req)
 
     def _open_seed(self, base, branch, name, vcs=None):
         if vcs is not None:
-            if vcs == SeedVcs.AUTO:
-                # Slightly dodgy auto-sensing, but if we can't tell then
-                # we'll try both.
-                if base.startswith('git'):
-                    vcs = SeedVcs.GIT
-                elif base.startswith('bzr'):
-                    vcs = SeedVcs.BZR
-            if vcs == SeedVcs.AUTO:
-                try:
-                    return self._open_seed_git(base, branch, name)
-                except SeedError:
-                    return self._open_seed_bzr(base, branch, name)
-            elif vcs == SeedVcs.GIT:
-                return self._open_seed_git(base, branch, name)
-            else:
-                return self._open_seed_bzr(base, branch, name)
+            return open(os.path.join(_checkout(base, branch, vcs), name))
         else:
             return self._open_seed_url(base, branch, name)
 
-    def __init__(self, bases, branches, name, vcs=None):
-        """Read a seed from a collection."""
+    def __init__(self, bases, branches, name, vcs=None, cache=False):
+        """Read a seed from a collection.
+
+        If cache is True, seeds downloaded over HTTP are kept in
+        $XDG_CACHE_HOME and only fetched again if they have changed.
+        """
         if isinstance(branches, _string_types):
             branches = [branches]
 
@@ -230,33 +355,33 @@ class Seed(object):
         self._base = None
         self._branch = None
         self._file = None
+        self._cache = cache
+
+        # The same (base, branch) pairs are tried here and, on failure,
+        # reported below.
+        attempts = [(base, branch) for base in bases for branch in branches]
 
         fd = None
         ssh_host = None
-        for base in bases:
-            for branch in branches:
-                try:
-                    fd = self._open_seed(base, branch, name, vcs=vcs)
-                    self._base = base
-                    self._branch = branch
-                    break
-                except SeedError:
-                    ssh_match = re.match(
-                        r'(?:bzr|git)\+ssh://(?:[^/]*?@)?(.*?)(?:/|$)', base)
-                    if ssh_match:
-                        ssh_host = ssh_match.group(1)
-                except (OSError, IOError, URLError):
-                    pass
-            if fd is not None:
+        for base, branch in attempts:
+            try:
+                fd = self._open_seed(base, branch, name, vcs=vcs)
+                self._base = base
+                self._branch = branch
                 break
+            except SeedError:
+                ssh_match = _ssh_base_re.match(base)
+                if ssh_match:
+                    ssh_host = ssh_match.group(1)
+            except (OSError, IOError, URLError):
+                pass
 
         if fd is None:
             if vcs is not None:
                 _logger.warning("Could not open %s from checkout of (any of):",
                                 name)
-                for base in bases:
-                    for branch in branches:
-                        _logger.warning('  %s' % os.path.join(base, branch))
+                for base, branch in attempts:
+                    _logger.warning('  %s' % os.path.join(base, branch))
 
                 if ssh_host is not None:
                     _logger.error("Do you need to set your user name on %s?",
@@ -268,12 +393,11 @@ class Seed(object):
                     _logger.error("        User YOUR_USER_NAME")
             else:
                 _logger.warning("Could not open (any of):")
-                for base in bases:
-                    for branch in branches:
-                        path = os.path.join(base, branch)
-                        if not path.endswith('/'):
-                            path += '/'
-                        _logger.warning('  %s' % urljoin(path, name))
+                for base, branch in attempts:
+                    path = os.path.join(base, branch)
+                    if not path.endswith('/'):
+                        path += '/'
+                    _logger.warning('  %s' % urljoin(path, name))
             raise SeedError("Could not open %s" % name)
 
         try:
@@ -453,8 +577,21 @@ class SeedStructure(collections.Mapping, object):
 
     """
 
-    def __init__(self, branch, seed_bases=None, vcs=None):
-        """Open a seed collection and read all the seeds it contains."""
+    def __init__(self, branch, seed_bases=None, vcs=None, cache=False,
+                 max_workers=None, cache_ttl=7):
+        """Open a seed collection and read all the seeds it contains.
+
+        If cache is True, seeds downloaded over HTTP are kept in
+        $XDG_CACHE_HOME and only fetched again if they have changed.
+        Cached seeds that have not been used for cache_ttl days are
+        removed.
+
+        Seeds are read using up to max_workers threads at once.  The
+        default is 8, unless a subclass overrides make_seed, in which case
+        seeds are read one at a time; such subclasses may pass max_workers
+        explicitly once their make_seed is safe to call from several
+        threads.
+        """
         if seed_bases is None:
             if vcs is None:
                 seed_bases = germinate.defaults.seeds
@@ -467,20 +604,58 @@ class SeedStructure(collections.Mapping, object):
         self._seed_bases = seed_bases
         self._branch = branch
         self._vcs = vcs
+        self._cache = cache
+        if max_workers is None:
+            if type(self).make_seed == SeedStructure.make_seed:
+                max_workers = _max_fetch_workers
+            else:
+                max_workers = 1
+        self._max_workers = max_workers
         self._features = set()
-        self._seed_order, self._inherit, branches, self._lines = \
+        self._seed_order, self._inherit, branches, lines = \
             self._parse(self._branch, set())
+        self._lines = list(lines.values())
         self._seeds = {}
-        for seed in self._seed_order:
-            self._seeds[seed] = self.make_seed(
-                seed_bases, branches, seed, vcs=vcs)
+        names = list(collections.OrderedDict.fromkeys(self._seed_order))
+
+        def make_seed(name):
+            return self.make_seed(seed_bases, branches, name, vcs=vcs)
+
+        if vcs is None and self._max_workers > 1 and len(names) > 1:
+            # Seeds in a URL collection are independent downloads, so
+            # overlap them.  VCS checkouts are shared between seeds and
+            # are made on first use, so those stay serial.
+            pool = ThreadPool(min(self._max_workers, len(names)))
+            try:
+                seeds = pool.map(make_seed, names)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            seeds = [make_seed(name) for name in names]
+        self._seeds.update(zip(names, seeds))
         self._expand_inheritance()
 
+        if cache and os.path.isdir(_seed_cache_dir()):
+            prune_cache(_seed_cache_dir(), cache_ttl)
+
     def _parse(self, branch, got_branches):
         all_seed_order = []
         all_inherit = {}
         all_branches = []
-        all_structure = []
+        seen_branches = set()
+        # Structure lines by seed name; a later line for the same seed
+        # replaces the earlier one and moves to the end.
+        all_structure = collections.OrderedDict()
+
+        def add_branch(branch):
+            if branch not in seen_branches:
+                all_branches.append(branch)
+                seen_branches.add(branch)
+
+        def add_structure_line(name, line):
+            all_structure.pop(name, None)
+            all_structure[name] = line
 
         # Fetch this one
         with self.make_seed(
@@ -488,6 +663,19 @@ class SeedStructure(collections.Mapping, object):
             structure = SingleSeedStructure(branch, seed)
         got_branches.add(branch)
 
+        # Each branch in a VCS collection is a separate checkout, so make
+        # all those we are about to need at once; the recursion below then
+        # reads them locally.  Failures are left for the recursion to
+        # retry and report.
+        child_branches = []
+        for child_branch in structure.branches:
+            if (child_branch not in got_branches and
+                    child_branch not in child_branches):
+                child_branches.append(child_branch)
+        if (self._vcs is not None and self._max_workers > 1 and
+                len(child_branches) > 1):
+            self._prefetch_branches(child_branches)
+
         # Recursively expand included branches
         for child_branch in structure.branches:
             if child_branch in got_branches:
@@ -497,30 +685,19 @@ class SeedStructure(collections.Mapping, object):
             all_seed_order.extend(child_seed_order)
             all_inherit.update(child_inherit)
             for grandchild_branch in child_branches:
-                if grandchild_branch not in all_branches:
-                    all_branches.append(grandchild_branch)
-            for child_structure_line in child_structure:
-                child_structure_name = child_structure_line.split()[0][:-1]
-                for i in range(len(all_structure)):
-                    if (all_structure[i].split()[0][:-1] ==
-                        child_structure_name):
-                        del all_structure[i]
-                        break
-                all_structure.append(child_structure_line)
+                add_branch(grandchild_branch)
+            for name, line in child_structure.items():
+                add_structure_line(name, line)
 
         # Attach the main branch's data to the end
         all_seed_order.extend(structure.seed_order)
         all_inherit.update(structure.inherit)
         for child_branch in structure.branches:
-            if child_branch not in all_branches:
-                all_branches.append(child_branch)
-        for structure_line in structure.lines:
-            structure_name = structure_line.split()[0][:-1]
-            for i in range(len(all_structure)):
-                if all_structure[i].split()[0][:-1] == structure_name:
-                    del all_structure[i]
-                    break
-            all_structure.append(structure_line)
+            add_branch(child_branch)
+        # Each structure line defines the seed at the same position in
+        # seed_order.
+        for name, line in zip(structure.seed_order, structure.lines):
+            add_structure_line(name, line)
         self._features.update(structure.features)
 
         # We generally want to process branches in reverse order, so that
@@ -529,19 +706,39 @@ class SeedStructure(collections.Mapping, object):
 
         return all_seed_order, all_inherit, all_branches, all_structure
 
+    def _prefetch_branches(self, branches):
+        """Check out several branches of a VCS collection in parallel."""
+        def prefetch(branch):
+            for base in self._seed_bases:
+                try:
+                    _checkout(base, branch, self._vcs)
+                    return
+                except (SeedError, OSError):
+                    pass
+
+        pool = ThreadPool(min(self._max_workers, len(branches)))
+        try:
+            pool.map(prefetch, branches)
+        finally:
+            pool.close()
+            pool.join()
+
     def make_seed(self, bases, branches, name, vcs=None):
         """Read a seed from this collection.
 
         This can be overridden by subclasses in order to read seeds in a
-        different way.
+        different way.  It is called from several threads at once if the
+        structure was created with max_workers greater than one, which is
+        only the default if this method is not overridden.
         """
-        return Seed(bases, branches, name, vcs=vcs)
+        return Seed(bases, branches, name, vcs=vcs, cache=self._cache)
 
     def _expand_inheritance(self):
         """Expand out incomplete inheritance lists."""
         self._original_inherit = dict(self._inherit)
 
         self._names = topo_sort(self._inherit)
+        self._outer = None
         for name in self._names:
             seen = set()
             new_inherit = []
@@ -558,12 +755,13 @@ class SeedStructure(collections.Mapping, object):
     def limit(self, seeds):
         """Restrict the seeds we care about to this list."""
         self._names = []
+        seen = set()
         for name in seeds:
-            for inherit in self._inherit[name]:
-                if inherit not in self._names:
+            for inherit in self._inherit[name] + [name]:
+                if inherit not in seen:
                     self._names.append(inherit)
-            if name not in self._names:
-                self._names.append(name)
+                    seen.add(inherit)
+        self._outer = None
 
     def add(self, name, entries, parent=None):
         """Add a custom seed."""
@@ -573,6 +771,7 @@ class SeedStructure(collections.Mapping, object):
         else:
             self._inherit[name] = [parent]
         self._seeds[name] = CustomSeed(name, entries)
+        self._outer = None
 
     def inner_seeds(self, seedname):
         """Return this seed and the seeds from which it inherits."""
@@ -582,11 +781,14 @@ class SeedStructure(collections.Mapping, object):
 
     def strictly_outer_seeds(self, seedname):
         """Return the seeds that inherit from this seed."""
-        outerseeds = []
-        for seed in self._names:
-            if seedname in self._inherit[seed]:
-                outerseeds.append(seed)
-        return outerseeds
+        if self._outer is None:
+            # Invert the inheritance map once rather than scanning every
+            # seed on each call.
+            self._outer = collections.defaultdict(list)
+            for seed in self._names:
+                for inherit in set(self._inherit[seed]):
+                    self._outer[inherit].append(seed)
+        return list(self._outer.get(seedname, []))
 
     def outer_seeds(self, seedname):
         """Return this seed and the seeds that inherit from it."""
@@ -649,7 +851,8 @@ class SeedStructure(collections.Mapping, object):
 
     def write_seed_text(self, filename, seedname):
         """Write the text of a seed in this collection."""
+        text = _ensure_unicode(self._seeds[seedname].text)
+        if text and not text.endswith('\n'):
+            text += '\n'
         with AtomicFile(filename) as f:
-            with self._seeds[seedname] as seed:
-                for line in seed:
-                    print(_ensure_unicode(line.rstrip('\n')), file=f)
+            f.write(text)
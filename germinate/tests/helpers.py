@@ -26,6 +26,12 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
 try:
     import unittest2 as unittest
 except ImportError:
@@ -42,6 +48,11 @@ else:
         return unicode(s, "unicode_escape")
 
 
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
 class TestCase(unittest.TestCase):
     def __init__(self, *args, **kwargs):
         unittest.TestCase.__init__(self, *args, **kwargs)
@@ -70,6 +81,27 @@ class TestCase(unittest.TestCase):
         self.seeds_dir = os.path.join(self.temp_dir, "seeds")
         os.makedirs(self.seeds_dir)
 
+    def useCacheHome(self):
+        """Point $XDG_CACHE_HOME at the temporary directory."""
+        self.useTempDir()
+        old_cache_home = os.environ.get("XDG_CACHE_HOME")
+        if old_cache_home is None:
+            self.addCleanup(os.environ.pop, "XDG_CACHE_HOME", None)
+        else:
+            self.addCleanup(
+                os.environ.__setitem__, "XDG_CACHE_HOME", old_cache_home)
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.temp_dir, "cache")
+
+    def serveHTTP(self, handler=QuietHTTPRequestHandler):
+        """Serve the current directory over HTTP, returning the base URL."""
+        server = HTTPServer(("127.0.0.1", 0), handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return "http://127.0.0.1:%d/" % server.server_address[1]
+
     def ensureDir(self, path):
         try:
             os.makedirs(path)
@@ -20,15 +20,194 @@
 
 import bz2
 import gzip
+import io
+import logging
 import os
+import re
 import subprocess
+import tempfile
 import textwrap
 
-from germinate.archive import IndexType, TagFile
-from germinate.tests.helpers import TestCase
+import germinate.archive
+from germinate.archive import IndexType, TagFile, _copy_decompressed
+from germinate.tests.helpers import QuietHTTPRequestHandler, TestCase
+
+
+class RangeHTTPRequestHandler(QuietHTTPRequestHandler):
+    """Serve files, supporting requests for a single byte range."""
+
+    ranges = []
+    # If False, advertise range support but ignore Range headers.
+    honour_ranges = True
+
+    def do_GET(self):
+        try:
+            with open(self.translate_path(self.path), "rb") as f:
+                data = f.read()
+        except IOError:
+            self.send_error(404)
+            return
+        match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range", ""))
+        if match and self.honour_ranges:
+            start, end = int(match.group(1)), int(match.group(2))
+            self.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range",
+                             "bytes %d-%d/%d" % (start, end, len(data)))
+            data = data[start:end + 1]
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def gzip_compress(data):
+    """Compress data with gzip; gzip.compress is new in Python 3.2."""
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as gzip_f:
+        gzip_f.write(data)
+    return compressed.getvalue()
+
+
+class RecordingHandler(logging.Handler):
+    """Remember the messages logged through this handler."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestCopyDecompressed(TestCase):
+    def tempFile(self):
+        self.useTempDir()
+        temp_file = open("decompressed", "w+b")
+        self.addCleanup(temp_file.close)
+        return temp_file
+
+    def test_concatenated_streams(self):
+        """Concatenated compressed streams are all decompressed."""
+        for suffix, compress in ((".gz", gzip_compress),
+                                 (".bz2", bz2.compress)):
+            data = compress(b"one\n") + compress(b"two\n")
+            for length in (1, 3, len(data)):
+                out_f = io.BytesIO()
+                _copy_decompressed(suffix, io.BytesIO(data), out_f, length)
+                self.assertEqual(b"one\ntwo\n", out_f.getvalue())
+
+    def test_xz(self):
+        """xz data is decompressed with or without the xz executable."""
+        lzma = germinate.archive.lzma
+        if lzma is None:
+            self.skipTest("lzma module not available")
+        data = lzma.compress(b"one\n") + lzma.compress(b"two\n")
+        self.addCleanup(setattr, germinate.archive, "_xz",
+                        germinate.archive._xz)
+        for xz in (germinate.archive._xz, None):
+            germinate.archive._xz = xz
+            out_f = io.BytesIO() if xz is None else self.tempFile()
+            _copy_decompressed(".xz", io.BytesIO(data), out_f)
+            out_f.seek(0)
+            self.assertEqual(b"one\ntwo\n", out_f.read())
+
+    def test_truncated(self):
+        """Truncated compressed data raises IOError."""
+        data = bz2.compress(b"one\n" * 100)
+        self.assertRaises(
+            IOError, _copy_decompressed,
+            ".bz2", io.BytesIO(data[:-10]), io.BytesIO())
+
+    def test_corrupt(self):
+        """Corrupt compressed data raises IOError."""
+        self.assertRaises(
+            IOError, _copy_decompressed,
+            ".gz", io.BytesIO(b"\x1f\x8b not gzip data"), io.BytesIO())
 
 
 class TestTagFile(TestCase):
+    def setUp(self):
+        super(TestTagFile, self).setUp()
+        self.useTempDir()
+
+    def mirrorURL(self, mirror="mirror"):
+        return "file://%s/%s" % (self.temp_dir, mirror)
+
+    def addIndex(self, index_type, text, suffix="", mirror="mirror"):
+        """Write a Packages or Sources file to a test mirror.
+
+        text is dedented and encoded as UTF-8, then compressed according
+        to suffix.  Return the name of the file that was written.
+
+        """
+        main_dir = os.path.join(mirror, "dists", "unstable", "main")
+        if index_type == "Packages":
+            path = os.path.join(main_dir, "binary-i386", "Packages")
+        else:
+            path = os.path.join(main_dir, "source", "Sources")
+        self.ensureParentDir(path)
+        data = textwrap.dedent(text).encode("UTF-8")
+        if suffix == ".gz":
+            with gzip.GzipFile(path + suffix, "wb") as index:
+                index.write(data)
+        elif suffix == ".bz2":
+            with bz2.BZ2File(path + suffix, "wb") as index:
+                index.write(data)
+        else:
+            with open(path, "wb") as index:
+                index.write(data)
+            if suffix == ".xz":
+                subprocess.check_call(["xz", path])
+        return path + suffix
+
+    def addBasicIndexes(self, suffix):
+        self.addIndex("Packages", b"""\
+            Package: test
+            Version: 1.0
+            Architecture: i386
+            Maintainer: \xc3\xba\xe1\xb8\x83\xc3\xba\xc3\xb1\xc5\xa7\xc5\xaf\x20\xc4\x91\xc9\x99\x76\xe1\xba\xbd\xc5\x82\xc3\xb5\xe1\xb9\x97\xc3\xa8\xc5\x97\xe1\xb9\xa1
+
+            """.decode("UTF-8"), suffix=suffix)
+        self.addIndex("Sources", """\
+            Source: test
+            Version: 1.0
+
+            """, suffix=suffix)
+
+    def assertBasicSections(self, sections):
+        self.assertEqual(IndexType.PACKAGES, sections[0][0])
+        self.assertEqual("test", sections[0][1]["Package"])
+        self.assertEqual("1.0", sections[0][1]["Version"])
+        self.assertEqual("i386", sections[0][1]["Architecture"])
+        self.assertEqual(IndexType.SOURCES, sections[1][0])
+        self.assertEqual("test", sections[1][1]["Source"])
+        self.assertEqual("1.0", sections[1][1]["Version"])
+
+    def addTestIndexes(self, suffix=""):
+        self.addIndex("Packages", """\
+            Package: test
+            Version: 1.0
+
+            """, suffix=suffix)
+        self.addIndex("Sources", """\
+            Source: test
+            Version: 1.0
+
+            """, suffix=suffix)
+
+    def recordLogs(self, name):
+        """Record INFO and higher messages sent to the named logger."""
+        logger = logging.getLogger(name)
+        handler = RecordingHandler()
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.addHandler(handler)
+        return handler
+
     def test_init_lists(self):
         """TagFile may be constructed with list parameters."""
         tagfile = TagFile(
@@ -49,110 +228,264 @@ class TestTagFile(TestCase):
         self.assertEqual(["mirror"], tagfile._mirrors)
         self.assertEqual(["source_mirror"], tagfile._source_mirrors)
 
+    def test_init_max_workers(self):
+        """TagFile defaults to a bounded number of download threads."""
+        self.assertEqual(4, TagFile("dist", "component", "arch",
+                                    "mirror")._max_workers)
+        self.assertEqual(16, TagFile("dist", "component", "arch",
+                                     ["mirror%d" % i
+                                      for i in range(8)])._max_workers)
+        self.assertEqual(2, TagFile("dist", "component", "arch", "mirror",
+                                    max_workers=2)._max_workers)
+
     def test_sections_gzip(self):
         """Test fetching sections from a basic TagFile archive using gzip."""
-        self.useTempDir()
-        main_dir = os.path.join("mirror", "dists", "unstable", "main")
-        binary_dir = os.path.join(main_dir, "binary-i386")
-        source_dir = os.path.join(main_dir, "source")
-        os.makedirs(binary_dir)
-        os.makedirs(source_dir)
-        with gzip.GzipFile(
-                os.path.join(binary_dir, "Packages.gz"), "wb") as packages:
-            packages.write(textwrap.dedent(b"""\
-                Package: test
-                Version: 1.0
-                Architecture: i386
-                Maintainer: \xc3\xba\xe1\xb8\x83\xc3\xba\xc3\xb1\xc5\xa7\xc5\xaf\x20\xc4\x91\xc9\x99\x76\xe1\xba\xbd\xc5\x82\xc3\xb5\xe1\xb9\x97\xc3\xa8\xc5\x97\xe1\xb9\xa1
-
-                """.decode("UTF-8")).encode("UTF-8"))
-        with gzip.GzipFile(
-                os.path.join(source_dir, "Sources.gz"), "wb") as sources:
-            sources.write(textwrap.dedent("""\
-                Source: test
-                Version: 1.0
+        self.addBasicIndexes(".gz")
+        tagfile = TagFile("unstable", "main", "i386", self.mirrorURL())
+        self.assertBasicSections(list(tagfile.sections()))
+        self.assertEqual(".gz", tagfile._suffix_cache[
+            (self.mirrorURL(), "unstable", "main", "Packages")])
 
-                """).encode("UTF-8"))
+    def test_sections_suffix_preference(self):
+        """The most preferred compression suffix wins when several exist."""
+        self.addIndex("Packages", "Package: uncompressed\n\n")
+        self.addIndex("Packages", "Package: gzip\n\n", suffix=".gz")
+        self.addIndex("Packages", "Package: bzip2\n\n", suffix=".bz2")
+        self.addIndex("Sources", "Source: test\n\n")
 
         tagfile = TagFile(
-            "unstable", "main", "i386", "file://%s/mirror" % self.temp_dir)
+            "unstable", "main", "i386", self.mirrorURL(),
+            installer_packages=False)
         sections = list(tagfile.sections())
-        self.assertEqual(IndexType.PACKAGES, sections[0][0])
-        self.assertEqual("test", sections[0][1]["Package"])
-        self.assertEqual("1.0", sections[0][1]["Version"])
-        self.assertEqual("i386", sections[0][1]["Architecture"])
-        self.assertEqual(IndexType.SOURCES, sections[1][0])
-        self.assertEqual("test", sections[1][1]["Source"])
-        self.assertEqual("1.0", sections[1][1]["Version"])
+        self.assertEqual("gzip", sections[0][1]["Package"])
 
-    def test_sections_bzip2(self):
-        """Test fetching sections from a basic TagFile archive using bzip2."""
-        self.useTempDir()
-        main_dir = os.path.join("mirror", "dists", "unstable", "main")
-        binary_dir = os.path.join(main_dir, "binary-i386")
-        source_dir = os.path.join(main_dir, "source")
-        os.makedirs(binary_dir)
-        os.makedirs(source_dir)
-        with bz2.BZ2File(
-                os.path.join(binary_dir, "Packages.bz2"), "wb") as packages:
-            packages.write(textwrap.dedent(b"""\
-                Package: test
-                Version: 1.0
-                Architecture: i386
-                Maintainer: \xc3\xba\xe1\xb8\x83\xc3\xba\xc3\xb1\xc5\xa7\xc5\xaf\x20\xc4\x91\xc9\x99\x76\xe1\xba\xbd\xc5\x82\xc3\xb5\xe1\xb9\x97\xc3\xa8\xc5\x97\xe1\xb9\xa1
-
-                """.decode("UTF-8")).encode("UTF-8"))
-        with bz2.BZ2File(
-                os.path.join(source_dir, "Sources.bz2"), "wb") as sources:
-            sources.write(textwrap.dedent("""\
-                Source: test
-                Version: 1.0
+    def test_sections_xz_unavailable(self):
+        """Without any way to decompress xz, another suffix is used."""
+        self.addIndex("Packages", "Package: xz\n\n", suffix=".xz")
+        self.addIndex("Packages", "Package: gzip\n\n", suffix=".gz")
+        self.addIndex("Sources", "Source: test\n\n")
+        self.addCleanup(setattr, germinate.archive, "_xz",
+                        germinate.archive._xz)
+        self.addCleanup(setattr, germinate.archive, "lzma",
+                        germinate.archive.lzma)
+        germinate.archive._xz = None
+        germinate.archive.lzma = None
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", self.mirrorURL(),
+            installer_packages=False)
+        sections = list(tagfile.sections())
+        self.assertEqual("gzip", sections[0][1]["Package"])
+        self.assertEqual(".gz", tagfile._suffix_cache[
+            (self.mirrorURL(), "unstable", "main", "Packages")])
 
-                """).encode("UTF-8"))
+    def test_sections_corrupt_fallback(self):
+        """A file that fails to decompress falls back to another suffix."""
+        path = self.addIndex("Packages", "Package: gzip\n\n", suffix=".gz")
+        with open(path[:-len(".gz")] + ".xz", "wb") as packages:
+            packages.write(b"\xfd7zXZ\x00 this is not xz data")
+        self.addIndex("Sources", "Source: test\n\n")
+        mirror = self.serveHTTP() + "mirror/"
 
         tagfile = TagFile(
-            "unstable", "main", "i386", "file://%s/mirror" % self.temp_dir)
+            "unstable", "main", "i386", mirror, installer_packages=False)
         sections = list(tagfile.sections())
-        self.assertEqual(IndexType.PACKAGES, sections[0][0])
-        self.assertEqual("test", sections[0][1]["Package"])
-        self.assertEqual("1.0", sections[0][1]["Version"])
-        self.assertEqual("i386", sections[0][1]["Architecture"])
-        self.assertEqual(IndexType.SOURCES, sections[1][0])
-        self.assertEqual("test", sections[1][1]["Source"])
-        self.assertEqual("1.0", sections[1][1]["Version"])
+        self.assertEqual("gzip", sections[0][1]["Package"])
+        self.assertEqual(".gz", tagfile._suffix_cache[
+            (mirror, "unstable", "main", "Packages")])
+
+    def test_sections_bzip2(self):
+        """Test fetching sections from a basic TagFile archive using bzip2."""
+        self.addBasicIndexes(".bz2")
+        tagfile = TagFile("unstable", "main", "i386", self.mirrorURL())
+        self.assertBasicSections(list(tagfile.sections()))
 
     def test_sections_xz(self):
         """Test fetching sections from a basic TagFile archive using xz."""
-        self.useTempDir()
-        main_dir = os.path.join("mirror", "dists", "unstable", "main")
-        binary_dir = os.path.join(main_dir, "binary-i386")
-        source_dir = os.path.join(main_dir, "source")
-        os.makedirs(binary_dir)
-        os.makedirs(source_dir)
-        with open(os.path.join(binary_dir, "Packages"), "wb") as packages:
-            packages.write(textwrap.dedent(b"""\
-                Package: test
+        self.addBasicIndexes(".xz")
+        tagfile = TagFile("unstable", "main", "i386", self.mirrorURL())
+        self.assertBasicSections(list(tagfile.sections()))
+
+    def test_sections_multiple_mirrors(self):
+        """Sections from multiple mirrors are yielded in mirror order."""
+        for mirror in ("one", "two"):
+            self.addIndex("Packages", """\
+                Package: test-%s
                 Version: 1.0
-                Architecture: i386
-                Maintainer: \xc3\xba\xe1\xb8\x83\xc3\xba\xc3\xb1\xc5\xa7\xc5\xaf\x20\xc4\x91\xc9\x99\x76\xe1\xba\xbd\xc5\x82\xc3\xb5\xe1\xb9\x97\xc3\xa8\xc5\x97\xe1\xb9\xa1
-
-                """.decode("UTF-8")).encode("UTF-8"))
-        subprocess.check_call(["xz", os.path.join(binary_dir, "Packages")])
-        with open(os.path.join(source_dir, "Sources"), "wb") as sources:
-            sources.write(textwrap.dedent("""\
-                Source: test
+
+                """ % mirror, mirror=mirror)
+            self.addIndex("Sources", """\
+                Source: test-%s
                 Version: 1.0
 
-                """).encode("UTF-8"))
-        subprocess.check_call(["xz", os.path.join(source_dir, "Sources")])
+                """ % mirror, mirror=mirror)
 
         tagfile = TagFile(
-            "unstable", "main", "i386", "file://%s/mirror" % self.temp_dir)
+            "unstable", "main", "i386",
+            [self.mirrorURL("one"), self.mirrorURL("two")],
+            installer_packages=False)
+        sections = [(indextype, section.get("Package", section.get("Source")))
+                    for indextype, section in tagfile.sections()]
+        self.assertEqual([
+            (IndexType.PACKAGES, "test-one"),
+            (IndexType.PACKAGES, "test-two"),
+            (IndexType.SOURCES, "test-one"),
+            (IndexType.SOURCES, "test-two"),
+            ], sections)
+
+    def test_sections_http_not_modified(self):
+        """Unchanged remote files are revalidated rather than downloaded."""
+        self.addTestIndexes(".gz")
+        mirror = self.serveHTTP() + "mirror/"
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", mirror, installer_packages=False)
+        self.assertEqual(2, len(list(tagfile.sections())))
+        handler = self.recordLogs("germinate.archive")
+        self.assertEqual(2, len(list(tagfile.sections())))
+        self.assertEqual(
+            2, len([message for message in handler.messages
+                    if "Using cached" in message]))
+
+    def test_sections_cached(self):
+        """Parsed sections are reused until the index file changes."""
+        self.addTestIndexes()
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", self.mirrorURL(),
+            installer_packages=False, cache_sections=True)
+        first = list(tagfile.sections())
+        second = list(tagfile.sections())
+        self.assertEqual(2, len(second))
+        for (_, first_section), (_, second_section) in zip(first, second):
+            self.assertIs(first_section, second_section)
+
+        self.addIndex("Packages", """\
+            Package: test
+            Version: 1.0
+
+            Package: test2
+            Version: 1.0
+
+            """)
+        third = list(tagfile.sections())
+        self.assertEqual(
+            ["test", "test2"],
+            [section["Package"] for indextype, section in third
+             if indextype == IndexType.PACKAGES])
+        self.assertIs(first[-1][1], third[-1][1])
+
+    def test_sections_cleanup(self):
+        """cleanup=True leaves no index files behind."""
+        self.useCacheHome()
+        self.addTestIndexes()
+        self.addCleanup(setattr, tempfile, "tempdir", tempfile.tempdir)
+        tempfile.tempdir = os.path.join(self.temp_dir, "tmp")
+        os.mkdir(tempfile.tempdir)
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", self.mirrorURL(),
+            installer_packages=False, cleanup=True, cache=True,
+            cache_sections=True)
+        self.assertEqual(2, len(list(tagfile.sections())))
+        self.assertEqual([], os.listdir(tempfile.tempdir))
+        self.assertFalse(os.path.exists("cache"))
+        self.assertEqual([], [name for name in os.listdir(".")
+                              if name.endswith("_Packages")])
+
+    def test_sections_cache(self):
+        """cache=True keeps index files in a pruned user cache."""
+        self.useCacheHome()
+        self.addTestIndexes()
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", self.mirrorURL(),
+            installer_packages=False, cache=True)
+        cache_dir = tagfile._cache_dir()
+        stale = os.path.join(cache_dir, "stale")
+        open(stale, "w").close()
+        os.utime(stale, (0, 0))
+        self.assertEqual(2, len(list(tagfile.sections())))
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+        self.assertEqual([], [name for name in os.listdir(".")
+                              if name.endswith("_Packages")])
+
+    def test_sections_cache_saved(self):
+        """cache=True with cache_sections=True reuses sections on disk."""
+        self.useCacheHome()
+        self.addTestIndexes()
+
+        def make_tagfile():
+            return TagFile(
+                "unstable", "main", "i386", self.mirrorURL(),
+                installer_packages=False, cache=True, cache_sections=True)
+
+        first = list(make_tagfile().sections())
+        cache_dir = make_tagfile()._cache_dir()
+        self.assertEqual(
+            2, len([name for name in os.listdir(cache_dir)
+                    if name.endswith(".sections")]))
+
+        self.addCleanup(setattr, germinate.archive.apt_pkg, "TagFile",
+                        germinate.archive.apt_pkg.TagFile)
+        germinate.archive.apt_pkg.TagFile = None
+        second = list(make_tagfile().sections())
+        self.assertEqual(first, second)
+
+    def test_sections_http_ranges(self):
+        """Large files may be downloaded in several byte ranges."""
+        self.addIndex("Packages", "".join(
+            "Package: test%d\nVersion: 1.0\n\n" % i for i in range(100)),
+            suffix=".gz")
+        self.addIndex("Sources", """\
+            Source: test
+            Version: 1.0
+
+            """)
+        self.addCleanup(setattr, germinate.archive, "_SEGMENT_THRESHOLD",
+                        germinate.archive._SEGMENT_THRESHOLD)
+        germinate.archive._SEGMENT_THRESHOLD = 0
+        RangeHTTPRequestHandler.ranges = []
+        mirror = self.serveHTTP(RangeHTTPRequestHandler) + "mirror/"
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", mirror, installer_packages=False,
+            download_segments=3)
         sections = list(tagfile.sections())
-        self.assertEqual(IndexType.PACKAGES, sections[0][0])
-        self.assertEqual("test", sections[0][1]["Package"])
-        self.assertEqual("1.0", sections[0][1]["Version"])
-        self.assertEqual("i386", sections[0][1]["Architecture"])
-        self.assertEqual(IndexType.SOURCES, sections[1][0])
-        self.assertEqual("test", sections[1][1]["Source"])
-        self.assertEqual("1.0", sections[1][1]["Version"])
+        self.assertEqual(
+            ["test%d" % i for i in range(100)],
+            [section["Package"] for indextype, section in sections
+             if indextype == IndexType.PACKAGES])
+        self.assertEqual(6, len(RangeHTTPRequestHandler.ranges))
+
+    def test_sections_http_ranges_ignored(self):
+        """If byte ranges fail, the file is fetched again in one piece."""
+        class IgnoreRangeHTTPRequestHandler(RangeHTTPRequestHandler):
+            honour_ranges = False
+
+        self.addIndex("Packages", "".join(
+            "Package: test%d\nVersion: 1.0\n\n" % i for i in range(100)),
+            suffix=".gz")
+        self.addIndex("Sources", """\
+            Source: test
+            Version: 1.0
+
+            """)
+        self.addCleanup(setattr, germinate.archive, "_SEGMENT_THRESHOLD",
+                        germinate.archive._SEGMENT_THRESHOLD)
+        germinate.archive._SEGMENT_THRESHOLD = 0
+        mirror = self.serveHTTP(IgnoreRangeHTTPRequestHandler) + "mirror/"
+        handler = self.recordLogs("germinate.archive")
+
+        tagfile = TagFile(
+            "unstable", "main", "i386", mirror, installer_packages=False,
+            download_segments=3)
+        sections = list(tagfile.sections())
+        self.assertEqual(
+            ["test%d" % i for i in range(100)],
+            [section["Package"] for indextype, section in sections
+             if indextype == IndexType.PACKAGES])
+        self.assertTrue([message for message in handler.messages
+                         if "retrying in one piece" in message])
+        self.assertEqual(".gz", tagfile._suffix_cache[
+            (mirror, "unstable", "main", "Packages")])
@@ -19,6 +19,7 @@
 # 02110-1301, USA.
 
 
+import io
 import shutil
 
 from germinate.archive import TagFile
@@ -134,6 +135,12 @@ class TestGerminatedSeed(TestCase):
 
 
 class TestGerminator(TestCase):
+    def packageFields(self, info):
+        return dict((field, info[field]) for field in (
+            "Section", "Version", "Maintainer", "Essential", "Pre-Depends",
+            "Built-Using", "Depends", "Recommends", "Size", "Installed-Size",
+            "Source", "Provides", "Kernel-Version", "Multi-Arch"))
+
     def test_parse_archive(self):
         """Germinator.parse_archive successfully parses a simple archive."""
         self.addSource("warty", "main", "hello", "1.0-1",
@@ -178,7 +185,7 @@ class TestGerminator(TestCase):
             "Provides": [],
             "Kernel-Version": "",
             "Multi-Arch": "none",
-            }, germinator._packages["hello"])
+            }, self.packageFields(germinator._packages["hello"]))
         self.assertEqual("deb", germinator._packagetype["hello"])
         self.assertIn("hello-dependency", germinator._packages)
         self.assertEqual({
@@ -196,7 +203,7 @@ class TestGerminator(TestCase):
             "Provides": [],
             "Kernel-Version": "",
             "Multi-Arch": "foreign",
-            }, germinator._packages["hello-dependency"])
+            }, self.packageFields(germinator._packages["hello-dependency"]))
         self.assertEqual("deb", germinator._packagetype["hello-dependency"])
         self.assertEqual({}, germinator._provides)
 
@@ -270,6 +277,35 @@ class TestGerminator(TestCase):
             shutil.rmtree(self.archive_dir)
             shutil.rmtree(self.seeds_dir)
 
+    def test_reverse_depends(self):
+        """Reverse dependencies are recorded once each, in sorted order."""
+        self.addSource("bionic", "main", "hello", "1.0-1",
+                       ["hello", "hello-dependency"])
+        self.addPackage("bionic", "main", "i386", "hello", "1.0-1",
+                        fields={"Depends": "libc6, libc6 (>= 2.0)"})
+        self.addPackage("bionic", "main", "i386", "hello-dependency", "1.0-1",
+                        fields={"Source": "hello", "Depends": "libc6"})
+        self.addSource("bionic", "main", "glibc", "2.27-3", ["libc6"])
+        self.addPackage("bionic", "main", "i386", "libc6", "2.27-3",
+                        fields={"Source": "glibc"})
+        branch = "ubuntu.bionic"
+        self.addSeed(branch, "base")
+        self.addSeedPackage(branch, "base", "hello-dependency")
+        self.addSeedPackage(branch, "base", "hello")
+        germinator = Germinator("i386")
+        archive = TagFile(
+            "bionic", "main", "i386", "file://%s" % self.archive_dir)
+        germinator.parse_archive(archive)
+        structure = self.openSeedStructure(branch)
+        germinator.plant_seeds(structure)
+        germinator.grow(structure)
+        germinator.reverse_depends(structure)
+
+        self.assertEqual(
+            ["hello", "hello-dependency"],
+            germinator._packages["libc6"].reverse_depends["Depends"])
+        self.assertIsNone(germinator._packages["hello"].reverse_depends)
+
     def test_build_depends_multiarch(self):
         """Compare Build-Depends behaviour against the multiarch specification.
 
@@ -400,6 +436,116 @@ class TestGerminator(TestCase):
         self.assertEqual(
             expected, germinator.get_depends(structure, "supported"))
 
+    def test_filter_packages(self):
+        """Germinator matches seed entries as globs or regular expressions."""
+        germinator = Germinator("i386")
+        packages = {"hello": None, "hello-dev": None, "goodbye": None}
+        self.assertEqual(
+            ["hello"], germinator._filter_packages(packages, "hello"))
+        self.assertEqual(
+            [], germinator._filter_packages(packages, "hello-doc"))
+        self.assertEqual(
+            ["hello", "hello-dev"],
+            germinator._filter_packages(packages, "hello*"))
+        self.assertEqual(
+            ["goodbye", "hello"],
+            germinator._filter_packages(packages, "/^[a-z]+$/"))
+
+    def test_substitute_seed_vars(self):
+        """Germinator expands substitution variables in seed entries."""
+        germinator = Germinator("i386")
+        substvars = {"kernel-version": ["4.15.0-1", "4.15.0-2"]}
+        self.assertEqual(
+            ["hello"], germinator._substitute_seed_vars(substvars, "hello"))
+        self.assertEqual(
+            ["linux-image-4.15.0-1", "linux-image-4.15.0-2"],
+            germinator._substitute_seed_vars(
+                substvars, "linux-image-${Kernel-Version}"))
+
+    def test_seed_entries(self):
+        """Duplicated and blacklisted seed entries are left out."""
+        self.addSource("bionic", "main", "hello", "1.0-1",
+                       ["hello", "hello-dependency"])
+        self.addPackage("bionic", "main", "i386", "hello", "1.0-1")
+        self.addPackage("bionic", "main", "i386", "hello-dependency", "1.0-1",
+                        fields={"Source": "hello"})
+        branch = "ubuntu.bionic"
+        self.addSeed(branch, "base")
+        self.addSeedPackage(branch, "base", "hello")
+        self.addSeedPackage(branch, "base", "hello-dependency")
+        self.addSeed(branch, "desktop", parents=["base"])
+        self.addSeedPackage(branch, "desktop", "hello")
+        self.addSeedPackage(branch, "desktop", "!hello-dependency")
+        germinator = Germinator("i386")
+        archive = TagFile(
+            "bionic", "main", "i386", "file://%s" % self.archive_dir)
+        germinator.parse_archive(archive)
+        structure = self.openSeedStructure(branch)
+        germinator.plant_seeds(structure)
+        germinator.grow(structure)
+
+        self.assertEqual(
+            ["hello"], germinator.get_seed_entries(structure, "base"))
+        self.assertEqual(
+            [], germinator.get_seed_entries(structure, "desktop"))
+
+    def test_hints(self):
+        """Hinted packages are added to the last seed that hints them."""
+        self.addSource("bionic", "main", "hello", "1.0-1",
+                       ["hello", "hello-dependency"])
+        self.addPackage("bionic", "main", "i386", "hello", "1.0-1")
+        self.addPackage("bionic", "main", "i386", "hello-dependency", "1.0-1",
+                        fields={"Source": "hello"})
+        branch = "ubuntu.bionic"
+        self.addSeed(branch, "base")
+        self.addSeedPackage(branch, "base", "hello")
+        self.addSeed(branch, "desktop", parents=["base"])
+        self.addSeedPackage(branch, "desktop", "hello")
+        germinator = Germinator("i386")
+        germinator.parse_hints(io.StringIO(u(
+            "desktop hello-dependency\n"
+            "base hello-dependency\n")))
+        archive = TagFile(
+            "bionic", "main", "i386", "file://%s" % self.archive_dir)
+        germinator.parse_archive(archive)
+        structure = self.openSeedStructure(branch)
+        germinator.plant_seeds(structure)
+        germinator.grow(structure)
+
+        self.assertEqual(
+            ["hello", "hello-dependency"],
+            germinator.get_seed_entries(structure, "base"))
+        self.assertEqual(
+            [], germinator.get_seed_entries(structure, "desktop"))
+
+    def test_add_extras(self):
+        """Germinator.add_extras follows sources pulled in by extras."""
+        self.addSource("bionic", "main", "hello", "1.0-1",
+                       ["hello", "hello-extra"])
+        self.addPackage("bionic", "main", "i386", "hello", "1.0-1")
+        self.addPackage("bionic", "main", "i386", "hello-extra", "1.0-1",
+                        fields={"Source": "hello", "Depends": "other"})
+        self.addSource("bionic", "main", "other", "1.0-1",
+                       ["other", "other-extra"])
+        self.addPackage("bionic", "main", "i386", "other", "1.0-1")
+        self.addPackage("bionic", "main", "i386", "other-extra", "1.0-1",
+                        fields={"Source": "other"})
+        branch = "ubuntu.bionic"
+        self.addSeed(branch, "supported")
+        self.addSeedPackage(branch, "supported", "hello")
+        germinator = Germinator("i386")
+        archive = TagFile(
+            "bionic", "main", "i386", "file://%s" % self.archive_dir)
+        germinator.parse_archive(archive)
+        structure = self.openSeedStructure(branch)
+        germinator.plant_seeds(structure)
+        germinator.grow(structure)
+        germinator.add_extras(structure)
+
+        self.assertEqual(
+            ["hello-extra", "other-extra"],
+            germinator.get_seed_entries(structure, "extra"))
+
     def test_snap(self):
         import logging
         from germinate.log import germinate_logging
@@ -19,6 +19,8 @@
 # 02110-1301, USA.
 
 import logging
+import sys
+import traceback
 
 from germinate.scripts import germinate_main
 from germinate.tests.helpers import TestCase
@@ -31,14 +33,17 @@ class TestGerminate(TestCase):
         logger.addHandler(handler)
         logger.propagate = False
 
-    def runGerminate(self, *args):
+    def germinateArgv(self, *args):
         self.useTempDir()
         self.addNullHandler()
         argv = ["germinate"]
         argv.extend(["-S", "file://%s" % self.seeds_dir])
         argv.extend(["-m", "file://%s" % self.archive_dir])
         argv.extend(args)
-        self.assertEqual(0, germinate_main.main(argv))
+        return argv
+
+    def runGerminate(self, *args):
+        self.assertEqual(0, germinate_main.main(self.germinateArgv(*args)))
 
     def parseOutput(self, output_name):
         output_dict = {}
@@ -71,6 +76,40 @@ class TestGerminate(TestCase):
         self.assertTrue("hello" in all_)
         self.assertTrue("hello-dependency" in all_)
 
+    def test_missing_seeds(self):
+        """A seed collection that cannot be fetched exits with status 1."""
+        self.addSource("warty", "main", "hello", "1.0-1", ["hello"])
+        self.addPackage("warty", "main", "i386", "hello", "1.0-1")
+        self.addSeed("ubuntu.warty", "supported")
+        self.addSeedPackage("ubuntu.warty", "supported", "hello")
+        argv = self.germinateArgv(
+            "-s", "ubuntu.hoary", "-d", "warty", "-c", "main")
+        with self.assertRaises(SystemExit) as cm:
+            germinate_main.main(argv)
+        self.assertEqual(1, cm.exception.code)
+
+    def test_seed_structure_error_traceback(self):
+        """Errors loading seeds keep the traceback of their cause."""
+        def broken_seed_structure(*args, **kwargs):
+            raise RuntimeError("broken")
+
+        self.addCleanup(setattr, germinate_main, "SeedStructure",
+                        germinate_main.SeedStructure)
+        germinate_main.SeedStructure = broken_seed_structure
+        self.addSource("warty", "main", "hello", "1.0-1", ["hello"])
+        self.addPackage("warty", "main", "i386", "hello", "1.0-1")
+        argv = self.germinateArgv("-s", "ubuntu.warty", "-d", "warty",
+                                  "-c", "main")
+        try:
+            germinate_main.main(argv)
+        except RuntimeError:
+            tb = sys.exc_info()[2]
+        else:
+            self.fail("RuntimeError not raised")
+        self.assertIn(
+            "broken_seed_structure",
+            [frame[2] for frame in traceback.extract_tb(tb)])
+
     def test_snap(self):
         # Need Packages
         self.addSource("warty", "main", "hello", "1.0-1",
@@ -18,16 +18,22 @@
 # Software Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
+from email.utils import formatdate
 import io
 import os
+import subprocess
 import textwrap
+import threading
 
+import germinate.seeds
 from germinate.seeds import (
     AtomicFile,
     Seed,
+    SeedStructure,
+    SeedVcs,
     SingleSeedStructure,
     )
-from germinate.tests.helpers import TestCase, u
+from germinate.tests.helpers import QuietHTTPRequestHandler, TestCase, u
 
 
 class TestAtomicFile(TestCase):
@@ -100,6 +106,72 @@ class TestSeed(TestCase):
             ["file://%s" % self.seeds_dir], ["collection.dist"], "test3")
         self.assertNotEqual(one, three)
 
+    def test_init_http(self):
+        """__init__ can fetch a seed over HTTP, trying each base in turn."""
+        if germinate.seeds.requests is None:
+            self.skipTest("requests module not available")
+        requests = []
+
+        class RecordingHTTPRequestHandler(QuietHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.path, self.headers.get("User-Agent")))
+                QuietHTTPRequestHandler.do_GET(self)
+
+        url = self.serveHTTP(RecordingHTTPRequestHandler)
+        seed = Seed(
+            [url + "missing", url + "seeds"], ["collection.dist"], "test")
+        self.assertEqual(url + "seeds", seed.base)
+        self.assertEqual(" * foo\n", seed.text)
+        self.assertEqual(
+            ["/missing/collection.dist/test", "/seeds/collection.dist/test"],
+            [path for path, _ in requests])
+        for _, user_agent in requests:
+            self.assertTrue(user_agent.startswith("python-requests/"))
+
+    def test_init_http_cache(self):
+        """Cached seeds are revalidated rather than downloaded again."""
+        if germinate.seeds.requests is None:
+            self.skipTest("requests module not available")
+        self.useCacheHome()
+        last_modified = formatdate(1000000000, usegmt=True)
+        requests = []
+
+        class ConditionalHTTPRequestHandler(QuietHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.headers.get("If-None-Match"),
+                                 self.headers.get("If-Modified-Since")))
+                if self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                with open(self.translate_path(self.path), "rb") as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header("ETag", '"v1"')
+                self.send_header("Last-Modified", last_modified)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        url = self.serveHTTP(ConditionalHTTPRequestHandler) + "seeds"
+        seed = Seed([url], ["collection.dist"], "test", cache=True)
+        self.assertEqual(" * foo\n", seed.text)
+        cache_path = germinate.seeds._seed_cache_path(
+            url + "/collection.dist/test")
+        self.assertEqual(1000000000, os.stat(cache_path).st_mtime)
+        with open(cache_path + ".etag") as etag:
+            self.assertEqual('"v1"\n', etag.read())
+
+        # A 304 response is served from the cache, and marks it as used.
+        os.utime(cache_path, (0, 1000000000))
+        self.addSeedPackage("collection.dist", "test", "bar")
+        seed = Seed([url], ["collection.dist"], "test", cache=True)
+        self.assertEqual(" * foo\n", seed.text)
+        self.assertNotEqual(0, os.stat(cache_path).st_atime)
+        self.assertEqual(1000000000, os.stat(cache_path).st_mtime)
+        self.assertEqual(
+            [(None, None), ('"v1"', last_modified)], requests)
+
     def test_open_without_scheme(self):
         """A Seed can be opened from a relative path on the filesystem."""
         seed = Seed([self.seeds_dir], ["collection.dist"], "test")
@@ -185,6 +257,93 @@ class TestSeedStructure(TestCase):
         self.assertEqual(two, structure["desktop"].branch)
         self.assertEqual(" * desktop-package\n", structure["desktop"].text)
 
+    def test_make_seed_override_serial(self):
+        """Overridden make_seed methods are only called from one thread."""
+        class RecordingSeedStructure(SeedStructure):
+            def make_seed(self, bases, branches, name, vcs=None):
+                threads.add(threading.current_thread())
+                return super(RecordingSeedStructure, self).make_seed(
+                    bases, branches, name, vcs=vcs)
+
+        threads = set()
+        branch = "collection.dist"
+        for name in ("one", "two", "three"):
+            self.addSeed(branch, name)
+            self.addSeedPackage(branch, name, "%s-package" % name)
+        structure = RecordingSeedStructure(
+            branch, seed_bases=["file://%s" % self.seeds_dir])
+        self.assertEqual(1, structure._max_workers)
+        self.assertEqual(set([threading.current_thread()]), threads)
+        self.assertEqual(
+            8, self.openSeedStructure(branch)._max_workers)
+
+    def test_cache_pruned(self):
+        """Cached seeds that have not been used recently are removed."""
+        branch = "collection.dist"
+        self.addSeed(branch, "base")
+        self.addSeedPackage(branch, "base", "base-package")
+        self.useCacheHome()
+        cache_dir = os.path.join(self.temp_dir, "cache", "germinate", "seeds")
+        os.makedirs(cache_dir)
+        stale = os.path.join(cache_dir, "stale")
+        fresh = os.path.join(cache_dir, "fresh")
+        open(stale, "w").close()
+        open(fresh, "w").close()
+        os.utime(stale, (0, 0))
+
+        SeedStructure(
+            branch, seed_bases=["file://%s" % self.seeds_dir], cache=True)
+        self.assertEqual(["fresh"], os.listdir(cache_dir))
+
+    def test_git_includes_parallel(self):
+        """Included git branches are cloned in parallel, once each."""
+        self.setUpDirs()
+        for repository in ("top", "one", "two"):
+            path = os.path.join(self.seeds_dir, repository)
+            if repository == "top":
+                self.addStructureLine(
+                    repository, "include one.dist two.dist one.dist")
+                self.addSeed(repository, "desktop", parents=["base", "extra"])
+                self.addSeedPackage(repository, "desktop", "desktop-package")
+            elif repository == "one":
+                self.addSeed(repository, "base")
+                self.addSeedPackage(repository, "base", "base-package")
+            else:
+                self.addSeed(repository, "extra", parents=["base"])
+                self.addSeedPackage(repository, "extra", "extra-package")
+            try:
+                for command in (
+                        ["init", "-q"],
+                        ["checkout", "-q", "-b", "dist"],
+                        ["add", "."],
+                        ["-c", "user.name=Test", "-c", "user.email=test@test",
+                         "commit", "-q", "-m", "seeds"]):
+                    subprocess.check_call(["git"] + command, cwd=path)
+            except OSError:
+                self.skipTest("git not available")
+        self.addCleanup(setattr, germinate.seeds, "_vcs_cache_dir",
+                        germinate.seeds._vcs_cache_dir)
+        germinate.seeds._vcs_cache_dir = os.path.join(self.temp_dir, "vcs")
+        os.mkdir(germinate.seeds._vcs_cache_dir)
+        checkouts = []
+        real_checkout = germinate.seeds._checkout
+
+        def checkout(base, branch, vcs):
+            checkouts.append((branch, threading.current_thread()))
+            return real_checkout(base, branch, vcs)
+
+        self.addCleanup(setattr, germinate.seeds, "_checkout", real_checkout)
+        germinate.seeds._checkout = checkout
+
+        structure = SeedStructure(
+            "top.dist", seed_bases=[self.seeds_dir], vcs=SeedVcs.GIT)
+        self.assertEqual(["base", "extra", "desktop"], structure.names)
+        self.assertEqual(" * base-package\n", structure["base"].text)
+        prefetched = sorted(
+            branch for branch, thread in checkouts
+            if thread is not threading.current_thread())
+        self.assertEqual(["one.dist", "two.dist"], prefetched)
+
     def test_later_branches_override_earlier_branches(self):
         """Seeds from later branches override seeds from earlier branches."""
         one = "one.dist"
@@ -235,6 +394,26 @@ class TestSeedStructure(TestCase):
         self.assertEqual(
             " * custom-one\n * custom-two\n", structure["custom"].text)
 
+    def test_outer_seeds(self):
+        """SeedStructure.outer_seeds returns seeds inheriting from a seed."""
+        branch = "collection.dist"
+        self.addSeed(branch, "one")
+        self.addSeedPackage(branch, "one", "one")
+        self.addSeed(branch, "two", parents=["one"])
+        self.addSeedPackage(branch, "two", "two")
+        self.addSeed(branch, "three", parents=["two"])
+        self.addSeedPackage(branch, "three", "three")
+        structure = self.openSeedStructure(branch)
+        self.assertEqual(
+            ["two", "three"], structure.strictly_outer_seeds("one"))
+        self.assertEqual(["two", "three"], structure.outer_seeds("two"))
+        self.assertEqual([], structure.strictly_outer_seeds("three"))
+        structure.add("custom", [" * custom"], "two")
+        self.assertEqual(
+            ["three", "custom"], structure.strictly_outer_seeds("two"))
+        structure.limit(["two"])
+        self.assertEqual(["two"], structure.strictly_outer_seeds("one"))
+
     def test_write(self):
         """SeedStructure.write writes the text of STRUCTURE."""
         branch = "collection.dist"
@@ -247,6 +426,25 @@ class TestSeedStructure(TestCase):
         with open("structure") as structure_file:
             self.assertEqual("one:\ntwo: one\n", structure_file.read())
 
+    def test_write_later_branches_override_earlier_branches(self):
+        """SeedStructure.write keeps only the last line for each seed."""
+        one = "one.dist"
+        two = "two.dist"
+        self.addSeed(one, "base")
+        self.addSeedPackage(one, "base", "base-package")
+        self.addSeed(one, "desktop", parents=["base"])
+        self.addSeedPackage(one, "desktop", "desktop-package-one")
+        self.addSeed(one, "server", parents=["base"])
+        self.addSeedPackage(one, "server", "server-package")
+        self.addStructureLine(two, "include one.dist")
+        self.addSeed(two, "desktop")
+        self.addSeedPackage(two, "desktop", "desktop-package-two")
+        structure = self.openSeedStructure(two)
+        structure.write("structure")
+        with open("structure") as structure_file:
+            self.assertEqual(
+                "base:\nserver: base\ndesktop:\n", structure_file.read())
+
     def test_write_dot(self):
         """SeedStructure.write_dot writes an appropriate dot file."""
         branch = "collection.dist"